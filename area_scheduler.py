@@ -0,0 +1,282 @@
+"""
+This module refreshes the covid data of the areas in the config file one shard at a time. Each area
+has its own refresh interval, priority and staleness budget, and the refreshes are spread out in
+small batches so hundreds of areas don't all hit the api at once
+"""
+
+# Imports
+import heapq
+import logging
+import time
+from threading import RLock
+from http_session import MAX_HOST_CONNECTIONS
+from resilience import backoff_delay
+
+# Defaults of the area settings in the config file
+DEFAULT_REFRESH_INTERVAL = 3600.0
+DEFAULT_PRIORITY = 1
+# Seconds between the start of each batch of refreshes
+BATCH_SPACING = 2.0
+
+
+def configured_areas(cfg: dict) -> list:
+    """
+    Gets the areas of the config file. The local and national locations are always included, first,
+    and areas without their own settings use the defaults
+
+    :param cfg: The config
+    :type: dict
+
+    :returns: list of area settings dictionaries with name, type, refresh_interval, priority and
+        max_staleness
+    :rtype: list
+    """
+    areas = [{"name": cfg['local_location'], "type": cfg['local_location_type'], "priority": 0},
+             {"name": cfg['national_location'], "type": cfg['national_location_type'], "priority": 0}]
+    areas.extend(cfg.get('areas', []))
+
+    settings = {}
+    for area in areas:
+        key = (area['name'], area['type'])
+        interval = float(area.get('refresh_interval', DEFAULT_REFRESH_INTERVAL))
+        # An area listed twice keeps its first settings
+        settings.setdefault(key, {"name": area['name'], "type": area['type'], "refresh_interval": interval,
+                                  "priority": int(area.get('priority', DEFAULT_PRIORITY)),
+                                  "max_staleness": float(area.get('max_staleness', 2 * interval))})
+    return list(settings.values())
+
+
+class AreaShard:
+    """The refresh settings and state of one area"""
+
+    __slots__ = ('name', 'type', 'refresh_interval', 'priority', 'max_staleness', 'due', 'refreshed', 'failures')
+
+    def __init__(self, settings: dict, due: float, refreshed: float):
+        """
+        Initialisation function for the class
+
+        :param settings: The area settings from configured_areas()
+        :type: dict
+        :param due: Time the first refresh is due
+        :type: float
+        :param refreshed: Time the data was last known to be up to date
+        :type: float
+        """
+        self.name = settings['name']
+        self.type = settings['type']
+        self.configure(settings)
+        self.due = due
+        self.refreshed = refreshed
+        self.failures = 0
+
+    @property
+    def key(self) -> tuple:
+        """
+        The (location, location_type) pair of the area
+
+        :rtype: tuple
+        """
+        return self.name, self.type
+
+    def configure(self, settings: dict) -> None:
+        """
+        Updates the refresh settings
+
+        :param settings: The area settings from configured_areas()
+        :type: dict
+
+        :rtype: None
+        """
+        self.refresh_interval = settings['refresh_interval']
+        self.priority = settings['priority']
+        self.max_staleness = settings['max_staleness']
+
+    def overdue(self, now: float) -> bool:
+        """
+        Whether the data of the area is older than its staleness budget
+
+        :param now: The current time
+        :type: float
+
+        :rtype: bool
+        """
+        return now - self.refreshed > self.max_staleness
+
+
+class AreaScheduler:
+    """
+    Refreshes the areas as their intervals come round, at most batch_size areas every batch_spacing
+    seconds. Areas past their staleness budget go first, then the ones with the lowest priority number.
+    It has the run(blocking=False) method of sched.scheduler so the scheduler service runs it like the
+    other queues
+    """
+
+    def __init__(self, load_config, refresh, batch_size: int = MAX_HOST_CONNECTIONS,
+                 batch_spacing: float = BATCH_SPACING):
+        """
+        Initialisation function for the class
+
+        :param load_config: function returning the config, the areas are set up again whenever it
+            returns a different config
+        :type: function
+        :param refresh: function given a list of (location, location_type) pairs to refresh,
+            returning the pairs that were refreshed
+        :type: function
+        :param batch_size: Most areas refreshed in one batch
+        :type: int
+        :param batch_spacing: Seconds between the start of each batch
+        :type: float
+        """
+        self.load_config = load_config
+        self.refresh = refresh
+        self.batch_size = batch_size
+        self.batch_spacing = batch_spacing
+        self.lock = RLock()
+        self.shards = {}
+        self.loaded = None
+        # Heap of (due, key), entries whose shard has since moved or gone are skipped
+        self.heap = []
+        self.next_batch = 0.0
+
+    def areas(self, now: float = None) -> dict:
+        """
+        Gets the shards, setting them up again if the area settings have changed. New areas are
+        spread over their refresh interval so they don't all come due together
+
+        :param now: The current time
+        :type: float
+
+        :returns: Dictionary of the shards keyed by (location, location_type)
+        :rtype: dict
+        """
+        with self.lock:
+            cfg = self.load_config()
+            if cfg is self.loaded:
+                return self.shards
+            now = now or time.time()
+            settings = configured_areas(cfg)
+            new = [area for area in settings if (area['name'], area['type']) not in self.shards]
+            shards = {}
+            for area in settings:
+                key = (area['name'], area['type'])
+                shard = self.shards.get(key)
+                if shard is not None:
+                    shard.configure(area)
+                    shards[key] = shard
+            for position, area in enumerate(new):
+                # The saved data is counted as fresh when the website starts
+                spread = position / len(new) * area['refresh_interval']
+                shards[(area['name'], area['type'])] = AreaShard(area, now + spread, now)
+            self.shards = shards
+            self.heap = [(shard.due, key) for key, shard in shards.items()]
+            heapq.heapify(self.heap)
+            self.loaded = cfg
+            return shards
+
+    def mark_refreshed(self, areas: list, now: float = None) -> None:
+        """
+        Records areas refreshed outside the scheduler, their next refresh stays where it is so
+        the areas stay spread out
+
+        :param areas: The (location, location_type) pairs refreshed
+        :type: list
+        :param now: The current time
+        :type: float
+
+        :rtype: None
+        """
+        with self.lock:
+            now = now or time.time()
+            shards = self.areas(now)
+            for key in areas:
+                shard = shards.get(key)
+                if shard is not None:
+                    shard.refreshed = now
+                    shard.failures = 0
+
+    def take_batch(self, now: float) -> list:
+        """
+        Takes the most urgent of the areas that are due, at most batch_size of them
+
+        :param now: The current time
+        :type: float
+
+        :returns: list of the shards taken
+        :rtype: list
+        """
+        with self.lock:
+            shards = self.areas(now)
+            due = {}
+            while self.heap and self.heap[0][0] <= now:
+                when, key = heapq.heappop(self.heap)
+                shard = shards.get(key)
+                if shard is not None and shard.due == when:
+                    due[key] = shard
+            ordered = sorted(due.values(), key=lambda shard: (not shard.overdue(now), shard.priority, shard.due))
+            # The rest wait for the next batch
+            for shard in ordered[self.batch_size:]:
+                heapq.heappush(self.heap, (shard.due, shard.key))
+            return ordered[:self.batch_size]
+
+    def finish(self, batch: list, refreshed: set, now: float) -> None:
+        """
+        Moves each area of a batch on to its next refresh, retrying failed areas with a backoff
+
+        :param batch: The shards refreshed
+        :type: list
+        :param refreshed: The (location, location_type) pairs that were refreshed
+        :type: set
+        :param now: The time the batch finished
+        :type: float
+
+        :rtype: None
+        """
+        with self.lock:
+            for shard in batch:
+                if self.shards.get(shard.key) is not shard:
+                    continue
+                if shard.key in refreshed:
+                    shard.refreshed = now
+                    shard.failures = 0
+                    # Moving on from the due time keeps the areas spread out
+                    while shard.due <= now:
+                        shard.due += shard.refresh_interval
+                else:
+                    shard.failures += 1
+                    shard.due = now + min(backoff_delay(shard.failures, base=30.0, cap=shard.refresh_interval),
+                                          shard.refresh_interval)
+                    if shard.overdue(now):
+                        logging.warning(f"Covid data for {shard.name} is past its staleness budget")
+                heapq.heappush(self.heap, (shard.due, shard.key))
+
+    def run(self, blocking: bool = False) -> float:
+        """
+        Refreshes the next batch of due areas, like sched.scheduler.run(blocking=False)
+
+        :param blocking: Not supported, the scheduler service does the waiting
+        :type: bool
+
+        :returns: Seconds until the next batch can run, None if there are no areas
+        :rtype: float
+        """
+        now = time.time()
+        if now < self.next_batch:
+            return self.next_batch - now
+
+        batch = self.take_batch(now)
+        if batch:
+            self.next_batch = now + self.batch_spacing
+            try:
+                refreshed = set(self.refresh([shard.key for shard in batch]))
+            except Exception as refresh_err:
+                logging.error(f"{refresh_err}: Failed to refresh covid data")
+                refreshed = set()
+            self.finish(batch, refreshed, time.time())
+
+        with self.lock:
+            shards = self.shards
+            while self.heap and getattr(shards.get(self.heap[0][1]), 'due', None) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            if not self.heap:
+                return None
+            return max(self.heap[0][0], self.next_batch) - time.time()
@@ -0,0 +1,205 @@
+"""
+This module searches the news articles kept in the metrics store with an inverted index held in
+memory. New and changed articles are added to the index as they are stored, so searches never scan
+the articles or ask the news api. Articles are dropped from the index once they are too old
+"""
+
+# Imports
+import heapq
+import itertools
+import math
+import re
+import time
+from threading import Lock
+from records import Article
+
+# How much a match in each field counts towards the score
+FIELD_WEIGHTS = (('title', 3.0), ('description', 2.0), ('content', 1.0))
+# Words too common to narrow a search down
+STOP_WORDS = frozenset(('a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it',
+                        'its', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'were', 'will', 'with'))
+# The news api cuts the content short and adds the number of characters left off, such as [+1234 chars]
+TRUNCATED = re.compile(r'\[\+\d+ chars\]')
+WORD = re.compile(r'\w+')
+# Seconds after it was published that an article can still be found
+ARTICLE_MAX_AGE = 30 * 24 * 3600.0
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits text into the lower case words that are indexed
+
+    :param text: The text, None is treated as no text
+    :type: str
+
+    :returns: list of words
+    :rtype: list
+    """
+    words = WORD.findall(TRUNCATED.sub(' ', text or '').lower())
+    return [word for word in words if word not in STOP_WORDS]
+
+
+def iso_time(seconds: float) -> str:
+    """
+    Formats a time like the publishedAt field of the news api
+
+    :param seconds: Seconds since the epoch
+    :type: float
+
+    :returns: The UTC time in ISO 8601 format
+    :rtype: str
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+class ArticleIndex:
+    """
+    Inverted index of the words in the title, description and content of the stored articles
+    published in the last max_age seconds
+    """
+
+    def __init__(self, max_age: float = ARTICLE_MAX_AGE):
+        """
+        Initialisation function for the class
+
+        :param max_age: Seconds after it was published that an article is dropped, None to keep
+            every article
+        :type: float
+        """
+        self.lock = Lock()
+        self.max_age = max_age
+        # Maps each word to {article id: weight of the word in the article}
+        self.postings = {}
+        self.articles = {}
+        # The words of each article, so a replaced article is taken out of only their postings
+        self.words = {}
+        # When each article was published, articles without a published time count from when they were added
+        self.published = {}
+        self.ids = {}
+        self.next_id = itertools.count()
+        self.last_updated = 0
+
+    def add(self, article: dict) -> int:
+        """
+        Adds an article to the index, replacing any article with the same url
+
+        :param article: The news article
+        :type: dict
+
+        :returns: The id of the article in the index
+        :rtype: int
+        """
+        url = article.get('url') or article['title']
+        weights = {}
+        for field, weight in FIELD_WEIGHTS:
+            for word in tokenize(article.get(field)):
+                weights[word] = weights.get(word, 0.0) + weight
+
+        with self.lock:
+            article_id = self.ids.get(url)
+            if article_id is None:
+                article_id = self.ids[url] = next(self.next_id)
+            else:
+                self.forget(article_id)
+            self.articles[article_id] = Article.of(article)
+            self.words[article_id] = tuple(weights)
+            self.published[article_id] = article.get('publishedAt') or iso_time(time.time())
+            for word, weight in weights.items():
+                self.postings.setdefault(word, {})[article_id] = weight
+        return article_id
+
+    def forget(self, article_id: int) -> None:
+        """
+        Takes an article out of the postings of its words, the caller holds the lock
+
+        :param article_id: The id of the article in the index
+        :type: int
+
+        :rtype: None
+        """
+        for word in self.words.pop(article_id, ()):
+            word_postings = self.postings[word]
+            word_postings.pop(article_id, None)
+            if not word_postings:
+                del self.postings[word]
+
+    def prune(self, now: float = None) -> int:
+        """
+        Drops the articles published more than max_age seconds ago
+
+        :param now: The current time
+        :type: float
+
+        :returns: The number of articles dropped
+        :rtype: int
+        """
+        if self.max_age is None:
+            return 0
+        cutoff = iso_time((now or time.time()) - self.max_age)
+        with self.lock:
+            old = {article_id for article_id, published in self.published.items() if published < cutoff}
+            for article_id in old:
+                self.forget(article_id)
+                del self.articles[article_id]
+                del self.published[article_id]
+            if old:
+                self.ids = {url: article_id for url, article_id in self.ids.items() if article_id not in old}
+        return len(old)
+
+    def sync(self, store, now: float = None) -> int:
+        """
+        Indexes the articles added to or changed in a metrics store since the last sync, then drops
+        the articles that have got too old
+
+        :param store: The metrics store
+        :type: MetricsStore
+        :param now: The current time
+        :type: float
+
+        :returns: The number of articles indexed
+        :rtype: int
+        """
+        now = now or time.time()
+        since = None if self.max_age is None else iso_time(now - self.max_age)
+        rows = store.articles_after(self.last_updated, since)
+        for updated, article in rows:
+            self.add(article)
+            self.last_updated = max(self.last_updated, updated)
+        self.prune(now)
+        return len(rows)
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """
+        Finds the articles with every word of a query, best matches first. Words in the title count
+        more than words in the description, which count more than words in the content
+
+        :param query: The words searched for
+        :type: str
+        :param limit: Most articles returned
+        :type: int
+
+        :returns: list of articles
+        :rtype: list
+        """
+        words = set(tokenize(query))
+        if not words:
+            return []
+        with self.lock:
+            postings = [self.postings.get(word, {}) for word in words]
+            # Starting from the rarest word keeps the intersection small
+            postings.sort(key=len)
+            matches = set(postings[0])
+            for word_postings in postings[1:]:
+                matches.intersection_update(word_postings)
+            if not matches:
+                return []
+
+            count = len(self.articles)
+            scores = {}
+            for word_postings in postings:
+                # Rarer words count for more
+                rarity = math.log(1 + count / len(word_postings))
+                for article_id in matches:
+                    scores[article_id] = scores.get(article_id, 0.0) + rarity * word_postings[article_id]
+            best = heapq.nlargest(limit, scores, key=lambda article_id: (scores[article_id], article_id))
+            return [self.articles[article_id] for article_id in best]
@@ -0,0 +1,200 @@
+"""
+This module keeps the news articles in memory so pages don't have to reload the JSON file
+"""
+
+# Imports
+import logging
+import os
+from json import load
+from threading import RLock, Timer
+from state_persistence import atomic_write_json, file_signature
+from instrumentation import FILE_LOAD_SECONDS
+from records import Article
+
+
+class ArticleStore:
+    """In-process store of the news articles, saved to a JSON file in the background"""
+
+    def __init__(self, filename: str = 'covid_news.json', visible_count: int = 4, save_delay: float = 1.0,
+                 on_save=None):
+        """
+        Initialisation function for the class
+
+        :param filename: The JSON file the articles are kept in
+        :type: str
+        :param visible_count: Number of articles shown at once
+        :type: int
+        :param save_delay: Seconds to wait after a change before saving, so bursts of changes are saved once
+        :type: float
+        :param on_save: function called after the articles are saved
+        :type: function
+        """
+        self.filename = filename
+        self.visible_count = visible_count
+        self.save_delay = save_delay
+        self.on_save = on_save
+        self.lock = RLock()
+        self.loaded = False
+        self.save_timer = None
+        # Signature of the file when it was last loaded or saved, another process changing it causes a reload
+        self.signature = None
+
+        self.articles = []
+        # Maps an article title to its position in self.articles
+        self.index = {}
+        self.removed = set()
+        self.removed_titles = set()
+        # Positions of the visible articles and the next position to fill them from
+        self.visible = []
+        self.cursor = 0
+
+    def load(self) -> None:
+        """
+        Loads the articles from the JSON file
+
+        :rtype: None
+        """
+        signature = file_signature(self.filename)
+        try:
+            with FILE_LOAD_SECONDS.time(file=os.path.basename(self.filename)), open(self.filename, 'r') as file:
+                articles = load(file)
+            logging.info("Getting news from JSON file")
+        except (OSError, ValueError) as load_err:
+            logging.error(f"{load_err}: Failed to load news from JSON file")
+            articles = []
+        with self.lock:
+            self.set_articles(articles)
+            self.loaded = True
+            self.signature = signature
+
+    def ensure_loaded(self) -> None:
+        """
+        Loads the articles if they haven't been loaded, or if another process has saved the file since.
+        Unsaved changes in this process are kept
+
+        :rtype: None
+        """
+        with self.lock:
+            if not self.loaded or (self.save_timer is None and file_signature(self.filename) != self.signature):
+                self.load()
+
+    def set_articles(self, articles: list) -> None:
+        """
+        Replaces the articles held in memory and resets the visible articles. Only the fields
+        the website uses are kept
+
+        :param articles: list of news articles
+        :type: list
+
+        :rtype: None
+        """
+        with self.lock:
+            self.articles = [Article.of(i) for i in articles if i['title'] not in self.removed_titles]
+            self.index = {}
+            for position, article in enumerate(self.articles):
+                self.index.setdefault(article['title'], position)
+            self.removed = set()
+            self.visible = []
+            self.cursor = 0
+            self.fill_visible()
+
+    def fill_visible(self) -> None:
+        """
+        Moves the cursor along to fill any gaps in the visible articles
+
+        :rtype: None
+        """
+        while len(self.visible) < self.visible_count and self.cursor < len(self.articles):
+            if self.cursor not in self.removed:
+                self.visible.append(self.cursor)
+            self.cursor += 1
+
+    def replace(self, articles: list) -> None:
+        """
+        Replaces all the articles, articles removed by the user are not brought back
+
+        :param articles: list of news articles
+        :type: list
+
+        :rtype: None
+        """
+        with self.lock:
+            self.set_articles(articles)
+            self.loaded = True
+        self.schedule_save()
+
+    def current(self) -> list:
+        """
+        Gets the articles currently shown on the website
+
+        :returns: list of news articles
+        :rtype: list
+        """
+        with self.lock:
+            self.ensure_loaded()
+            return [self.articles[i] for i in self.visible]
+
+    def remove(self, title: str) -> bool:
+        """
+        Removes an article by its title, the next article takes its place
+
+        :param title: title of the news article
+        :type: str
+
+        :returns: True if the article was found
+        :rtype: bool
+        """
+        with self.lock:
+            self.ensure_loaded()
+            position = self.index.pop(title, None)
+            if position is None:
+                return False
+            self.removed_titles.add(title)
+            self.removed.add(position)
+            if position in self.visible:
+                self.visible.remove(position)
+                self.fill_visible()
+        self.schedule_save()
+        return True
+
+    def all_articles(self) -> list:
+        """
+        Gets every article that hasn't been removed
+
+        :returns: list of news articles
+        :rtype: list
+        """
+        with self.lock:
+            self.ensure_loaded()
+            return [article for position, article in enumerate(self.articles) if position not in self.removed]
+
+    def schedule_save(self) -> None:
+        """
+        Saves the articles after save_delay seconds unless a save is already waiting
+
+        :rtype: None
+        """
+        with self.lock:
+            if self.save_timer is not None:
+                return
+            self.save_timer = Timer(self.save_delay, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def save(self) -> None:
+        """
+        Writes the articles to the JSON file
+
+        :rtype: None
+        """
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            articles = self.all_articles()
+        atomic_write_json(self.filename, articles)
+        with self.lock:
+            self.signature = file_signature(self.filename)
+        logging.info("Updating news")
+        if self.on_save is not None:
+            self.on_save()
@@ -0,0 +1,341 @@
+"""
+This module runs the benchmarks of the data hub fully offline and compares them to a saved baseline.
+The covid csv and news JSON in the repo are the recorded fixtures, they are scaled up for the large
+inputs and served by a local stub server in place of the apis
+
+    python benchmark.py            runs the benchmarks and fails if any are slower than the baseline
+    python benchmark.py --save     runs the benchmarks and saves them as the new baseline
+"""
+
+# Imports
+import argparse
+import csv
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, load
+from threading import Thread
+from urllib.parse import urlsplit, parse_qs
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_FIXTURE = os.path.join(REPO_DIR, 'nation_2021-10-28.csv')
+NEWS_FIXTURE = os.path.join(REPO_DIR, 'covid_news.json')
+BASELINE_FILE = os.path.join(REPO_DIR, 'benchmark_baseline.json')
+# How much slower than the baseline a benchmark may be before it counts as a regression
+TOLERANCE = 0.5
+
+# Maps the name of each benchmark to its setup function
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """
+    Decorator that registers a benchmark. The setup function takes the scale of the inputs and
+    returns the function that is timed
+
+    :param name: Name of the benchmark
+    :type: str
+
+    :returns: The decorator
+    :rtype: function
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def load_api_rows(area_name: str = 'England', area_type: str = 'nation') -> list:
+    """
+    Converts the recorded csv into covid api rows, newest first
+
+    :param area_name: Area name given to the rows
+    :type: str
+    :param area_type: Area type given to the rows
+    :type: str
+
+    :returns: list of covid api rows
+    :rtype: list
+    """
+    def number(value):
+        return int(value) if value else None
+
+    with open(CSV_FIXTURE, 'r') as file:
+        return [{"areaCode": row['areaCode'], "areaName": area_name, "areaType": area_type, "date": row['date'],
+                 "newCasesByPublishDate": number(row['newCasesBySpecimenDate']),
+                 "hospitalCases": number(row['hospitalCases']),
+                 "cumDeaths28DaysByDeathDate": number(row['cumDailyNsoDeathsByDeathDate'])}
+                for row in csv.DictReader(file)]
+
+
+def load_articles() -> list:
+    """
+    Loads the recorded news articles
+
+    :returns: list of news articles
+    :rtype: list
+    """
+    with open(NEWS_FIXTURE, 'r') as file:
+        return load(file)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers covid and news api requests from the recorded fixtures"""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/covid'):
+            filters = dict(part.split('=', 1) for part in query['filters'][0].split(';'))
+            body = {"data": load_api_rows(filters['areaName'], filters['areaType']), "pagination": {}}
+        else:
+            body = {"status": "ok", "articles": load_articles()}
+        data = dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def offline_environment():
+    """
+    Runs the benchmarks in a temporary directory with the apis pointed at a local stub server,
+    so nothing touches the network or the files in the repo
+
+    :returns: Context manager giving the imported main module
+    :rtype: object
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    old_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp()
+    originals = {}
+    try:
+        for name in ('config.json', 'covid_news.json'):
+            shutil.copy(os.path.join(REPO_DIR, name), work_dir)
+        os.chdir(work_dir)
+        if REPO_DIR not in sys.path:
+            sys.path.insert(0, REPO_DIR)
+
+        import covid_data_handling
+        import news_data_handling
+        import main
+        from article_store import ArticleStore
+        from metrics_store import MetricsStore
+        from job_store import JobStore
+
+        # The patched module variables are put back afterwards, main may already be in use
+        patches = {covid_data_handling: {"COVID_API_URL": f"{base_url}/covid"},
+                   news_data_handling: {"NEWS_API_URL": f"{base_url}/news", "news_api_key": 'offline'},
+                   main: {"news_store": ArticleStore(os.path.join(work_dir, 'covid_news.json'), save_delay=3600),
+                          "metrics_store": MetricsStore(os.path.join(work_dir, 'covid_data.db')),
+                          "job_store": JobStore(os.path.join(work_dir, 'scheduled_updates.json'), save_delay=3600),
+                          # Refreshes are benchmarked on their own, not every time the website is set up
+                          "dump_data": lambda s=None: None, "dump_news": lambda s=None: None}}
+        for module, values in patches.items():
+            originals[module] = {name: getattr(module, name) for name in values}
+            for name, value in values.items():
+                setattr(module, name, value)
+        main.metrics_store.upsert_records(load_api_rows('Exeter', 'ltla') + load_api_rows('England', 'nation'))
+        yield main
+    finally:
+        for module, values in originals.items():
+            for name, value in values.items():
+                setattr(module, name, value)
+        server.shutdown()
+        os.chdir(old_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+@benchmark('csv_parse_and_process')
+def bench_csv(scale: int):
+    from covid_data_handling import parse_csv_data, process_covid_csv_data
+    with open(CSV_FIXTURE, 'r') as file:
+        header, *rows = file.readlines()
+    with open('scaled.csv', 'w') as file:
+        file.write(header)
+        file.writelines(rows * scale)
+    return lambda: process_covid_csv_data(parse_csv_data('scaled.csv'))
+
+
+@benchmark('process_json_data')
+def bench_json(scale: int):
+    from covid_data_handling import process_json_data
+    rows = load_api_rows() * scale
+    return lambda: process_json_data(rows)
+
+
+@benchmark('remove_duplicates')
+def bench_dedup(scale: int):
+    from news_data_handling import remove_duplicates
+    # Copies of each recorded article with new urls and slightly different titles
+    articles = [dict(article, title=f"{article['title']} {n}", url=f"{article['url']}?n={n}")
+                for n in range(scale * 5) for article in load_articles()]
+    return lambda: list(remove_duplicates(articles, similarity=0.8))
+
+
+@benchmark('article_search')
+def bench_search(scale: int):
+    from article_search import ArticleIndex
+    index = ArticleIndex()
+    for n in range(scale * 5):
+        for article in load_articles():
+            index.add(dict(article, url=f"{article['url']}?n={n}"))
+    queries = ['covid', 'ireland nightclubs', 'vaccine booster', 'hospital cases england']
+    return lambda: [index.search(query) for query in queries * scale]
+
+
+@benchmark('fetch_areas_stub')
+def bench_fetch(scale: int):
+    import covid_data_handling
+    areas = [(f"Area {n}", 'ltla') for n in range(scale)]
+
+    def fetch():
+        covid_data_handling.area_cache.clear()
+        return covid_data_handling.fetch_areas(areas)
+    return fetch
+
+
+@benchmark('news_api_request_stub')
+def bench_news(scale: int):
+    from news_data_handling import news_api_request
+    return lambda: news_api_request(' '.join(f"term{n}" for n in range(scale)))
+
+
+@benchmark('pop_updates')
+def bench_pop_updates(scale: int):
+    import main
+    server = main.Covid19DataHub()
+    titles = [f"update {n}" for n in range(scale * 100)]
+
+    def add_and_pop():
+        for title in titles:
+            server.update_scheduler({"title": title, "content": "", "alarm": "09:00", "repeat": False,
+                                     "data": True, "news": True})
+        for title in titles:
+            server.pop_updates(title)
+    return add_and_pop
+
+
+@benchmark('render_app_uncached')
+def bench_render(scale: int):
+    import main
+    app = main.Flask(main.__name__)
+    server = main.Covid19DataHub()
+    app.add_url_rule('/', view_func=server.render_app)
+    client = app.test_client()
+
+    def render():
+        for _ in range(scale):
+            main.dashboard.invalidate()
+            client.get('/')
+    return render
+
+
+@benchmark('render_app_cached')
+def bench_render_cached(scale: int):
+    import main
+    app = main.Flask(main.__name__)
+    server = main.Covid19DataHub()
+    app.add_url_rule('/', view_func=server.render_app)
+    client = app.test_client()
+
+    def render():
+        for _ in range(scale * 10):
+            client.get('/')
+    return render
+
+
+def measure(func, repeat: int = 5) -> float:
+    """
+    Times a function, after one warm up run
+
+    :param func: The function timed
+    :type: function
+    :param repeat: Number of timed runs
+    :type: int
+
+    :returns: The median time of a run in seconds
+    :rtype: float
+    """
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run_benchmarks(names: list = None, scale: int = 50, repeat: int = 5) -> dict:
+    """
+    Runs the benchmarks offline
+
+    :param names: Names of the benchmarks run, None runs them all
+    :type: list
+    :param scale: How many times larger than the fixtures the inputs are
+    :type: int
+    :param repeat: Number of timed runs of each benchmark
+    :type: int
+
+    :returns: Dictionary of the median seconds of each benchmark
+    :rtype: dict
+    """
+    results = {}
+    with offline_environment():
+        for name in names or BENCHMARKS:
+            results[name] = measure(BENCHMARKS[name](scale), repeat)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """
+    Finds the benchmarks that are slower than the baseline by more than the tolerance
+
+    :param results: Dictionary of the median seconds of each benchmark
+    :type: dict
+    :param baseline: The saved results
+    :type: dict
+    :param tolerance: Fraction slower than the baseline that is allowed
+    :type: float
+
+    :returns: list of (name, seconds, baseline seconds) of each regression
+    :rtype: list
+    """
+    return [(name, seconds, baseline[name]) for name, seconds in results.items()
+            if name in baseline and seconds > baseline[name] * (1 + tolerance)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all of them by default')
+    parser.add_argument('--save', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--scale', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.names, args.scale)
+    for name, seconds in results.items():
+        print(f"{name:<24}{seconds * 1000:10.2f} ms")
+
+    if args.save:
+        with open(BASELINE_FILE, 'w') as file:
+            file.write(dumps(results, indent=2) + '\n')
+        print(f"Saved the baseline to {BASELINE_FILE}")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r') as file:
+            regressions = compare(results, load(file), args.tolerance)
+        for name, seconds, before in regressions:
+            print(f"REGRESSION {name}: {seconds * 1000:.2f} ms, baseline {before * 1000:.2f} ms")
+        sys.exit(1 if regressions else 0)
@@ -3,13 +3,32 @@ This module is for handling the covid data
 """
 
 # Imports
+import csv
 import logging
-from requests import get
+from concurrent.futures import ThreadPoolExecutor
 from json import dumps
-from sched import scheduler
+from threading import Lock
 import time
+from http_session import api_get, MAX_HOST_CONNECTIONS
+from instrumentation import UPSTREAM_SECONDS, UPSTREAM_ERRORS, CACHE_REQUESTS
+from records import CovidRecord
+from scheduler_service import TimedScheduler
 
-data_scheduler = scheduler(time.time, time.sleep)
+data_scheduler = TimedScheduler(time.time, time.sleep)
+
+COVID_API_URL = 'https://api.coronavirus.data.gov.uk/v1/data'
+# Seconds a cached area response is used before it is revalidated
+CACHE_TTL = 300.0
+
+# Headers of the columns read from the government dashboard csv exports
+CSV_CASES_COLUMN = 'newCasesBySpecimenDate'
+CSV_HOSPITAL_COLUMN = 'hospitalCases'
+CSV_DEATHS_COLUMN = 'cumDailyNsoDeathsByDeathDate'
+
+# Cached responses keyed by (areaName, areaType)
+area_cache = {}
+area_locks = {}
+area_locks_lock = Lock()
 
 
 def process_json_data(covid_java_data: dict) -> (int, int, int):
@@ -23,50 +42,35 @@ def process_json_data(covid_java_data: dict) -> (int, int, int):
     :returns: The three variables as specified
     :rtype: (int, int, int)
     """
-    last7days_cases = 0
-    current_hospital_cases = 0
-    total_deaths = 0
+    # NumPy is imported on first use so the website starts without waiting for it
+    from covid_timeseries import CovidTimeSeries
+    return CovidTimeSeries.from_api_rows(covid_java_data).summary()
 
-    # Process for the last7days_cases
-    for i in range(2, 8):
-        last7days_cases += int(float(covid_java_data[i]["newCasesByPublishDate"]))
 
-    # Process for the current_hospital_cases
-    for i in covid_java_data:
-        value = i["hospitalCases"]
-        if value is not None:
-            current_hospital_cases = int(value)
-            break
-
-    # Process for the total_deaths
-    for i in covid_java_data:
-        value = i["cumDeaths28DaysByDeathDate"]
-        if value is not None:
-            total_deaths = int(value)
-            break
-
-    return last7days_cases, current_hospital_cases, total_deaths
-
-
-def covid_api_request(location: str = "Exeter", location_type: str = "ltla") -> dict:
+def covid_api_params(location: str, location_type: str, date: str = None, page: int = None) -> dict:
     """
-    Makes a request to get the current covid data from a specified location
+    Builds the query parameters for a request to the covid api
 
     :param location: The specified location
     :type: str
     :param location_type: The location type
     :type: str
+    :param date: Only get the data of this YYYY-MM-DD date
+    :type: str
+    :param page: The page of the results to get
+    :type: int
 
-    :returns: Dictionary of the covid data
-    :type: dict
+    :returns: Dictionary of the query parameters
+    :rtype: dict
     """
-
-    url = 'https://api.coronavirus.data.gov.uk/v1/data'
     filters = [
         f"areaType={location_type}",
         f"areaName={location}"
     ]
+    if date is not None:
+        filters.append(f"date={date}")
     data_structure = {
+        "areaCode": "areaCode",
         "areaName": "areaName",
         "areaType": "areaType",
         "date": "date",
@@ -79,17 +83,147 @@ def covid_api_request(location: str = "Exeter", location_type: str = "ltla") ->
         "filters": str.join(";", filters),
         "structure": dumps(data_structure, separators=(",", ":"))
     }
+    if page is not None:
+        api_params["page"] = page
+    return api_params
 
-    response = get(url, params=api_params, timeout=10)
+
+def covid_api_request(location: str = "Exeter", location_type: str = "ltla",
+                      date: str = None, page: int = None) -> dict:
+    """
+    Makes a request to get the current covid data from a specified location
+
+    :param location: The specified location
+    :type: str
+    :param location_type: The location type
+    :type: str
+    :param date: Only get the data of this YYYY-MM-DD date
+    :type: str
+    :param page: The page of the results to get
+    :type: int
+
+    :returns: Dictionary of the covid data
+    :type: dict
+    """
+
+    try:
+        with UPSTREAM_SECONDS.time(call='covid_api_request'):
+            response = api_get(COVID_API_URL, params=covid_api_params(location, location_type, date, page),
+                               timeout=10)
+    except Exception:
+        UPSTREAM_ERRORS.inc(api='covid')
+        raise
 
     if response.status_code >= 400:
+        UPSTREAM_ERRORS.inc(api='covid')
         logging.error(f'Request failed: {response.text}')
         raise RuntimeError(f'Request failed: {response.text}')
 
+    # The api has no content when there is no data for the filters
+    if response.status_code == 204:
+        return {"data": [], "pagination": {}}
+
     url_response = response.json()
     return url_response
 
 
+def fetch_area(location: str, location_type: str, max_age: float = CACHE_TTL) -> dict:
+    """
+    Gets the covid data for an area, making at most one request per area every max_age seconds.
+    Stale entries are revalidated with a conditional request so unchanged data isn't downloaded again,
+    and are used as they are if the api fails
+
+    :param location: The specified location
+    :type: str
+    :param location_type: The location type
+    :type: str
+    :param max_age: Seconds a cached response is used without asking the api
+    :type: float
+
+    :returns: Dictionary of the covid data
+    :rtype: dict
+    """
+    key = (location, location_type)
+    with area_locks_lock:
+        lock = area_locks.setdefault(key, Lock())
+
+    # Only one thread fetches an area at a time, any others wait and use its result
+    with lock:
+        entry = area_cache.get(key)
+        if entry is not None and time.time() - entry['fetched'] < max_age:
+            logging.info(f"Using cached covid data for {location}")
+            CACHE_REQUESTS.inc(cache='area', result='hit')
+            return entry['data']
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            with UPSTREAM_SECONDS.time(call='fetch_area'):
+                response = api_get(COVID_API_URL, params=covid_api_params(location, location_type),
+                                   headers=headers, timeout=10)
+            if response.status_code >= 400:
+                logging.error(f'Request failed: {response.text}')
+                raise RuntimeError(f'Request failed: {response.text}')
+        except Exception as request_err:
+            UPSTREAM_ERRORS.inc(api='covid')
+            # The last good data is used until the api recovers
+            if entry is None:
+                raise
+            logging.error(f"{request_err}: Using stale covid data for {location}")
+            CACHE_REQUESTS.inc(cache='area', result='stale')
+            return entry['data']
+
+        if response.status_code == 304 and entry is not None:
+            logging.info(f"Covid data for {location} not modified")
+            CACHE_REQUESTS.inc(cache='area', result='revalidated')
+            entry['fetched'] = time.time()
+            return entry['data']
+
+        CACHE_REQUESTS.inc(cache='area', result='miss')
+
+        data = response.json()
+        # The rows are kept as records, only the fields used are held in memory
+        data['data'] = [CovidRecord.from_dict(row) for row in data.get('data') or []]
+        area_cache[key] = {"data": data,
+                           "etag": response.headers.get('ETag'),
+                           "last_modified": response.headers.get('Last-Modified'),
+                           "fetched": time.time()}
+        return data
+
+
+def fetch_areas(areas: list, max_age: float = CACHE_TTL) -> dict:
+    """
+    Gets the covid data for many areas at once, fetching them concurrently over the shared session.
+    Areas that fail to update are logged and left out of the result
+
+    :param areas: list of (location, location_type) pairs
+    :type: list
+    :param max_age: Seconds a cached response is used without asking the api
+    :type: float
+
+    :returns: Dictionary of the covid data keyed by (location, location_type)
+    :rtype: dict
+    """
+    areas = list(dict.fromkeys(tuple(area) for area in areas))
+    if not areas:
+        return {}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(len(areas), MAX_HOST_CONNECTIONS)) as pool:
+        futures = {area: pool.submit(fetch_area, area[0], area[1], max_age) for area in areas}
+        for area, future in futures.items():
+            try:
+                results[area] = future.result()
+            except Exception as area_err:
+                logging.error(f"{area_err}: Failed to fetch covid data for {area[0]}")
+    return results
+
+
 def schedule_covid_updates(update_interval: float = 3600.0, update_name: str = None) -> None:
     """
     Adds an event to update the covid data at a specified time
@@ -116,11 +250,56 @@ def parse_csv_data(csv_filename: str) -> list:
     :returns: the parsed csv data
     :rtype: list
     """
-    list_of_data = []
-    file = open(csv_filename).readlines()
-    for i in file:
-        list_of_data.append(i.strip())
-    return list_of_data
+    with open(csv_filename) as file:
+        return [i.strip() for i in file]
+
+
+def iter_csv_rows(csv_filename: str) -> list:
+    """
+    Reads the rows of a csv file one at a time, the file is closed once the rows stop being read
+
+    :param csv_filename: the name of the csv file
+    :type: str
+
+    :returns: dictionary of each row keyed by the header names
+    :rtype: list
+    """
+    with open(csv_filename, newline='') as file:
+        for row in csv.DictReader(file):
+            yield row
+
+
+def summarise_csv_rows(rows: list, cases_column: str = CSV_CASES_COLUMN,
+                       hospital_column: str = CSV_HOSPITAL_COLUMN,
+                       deaths_column: str = CSV_DEATHS_COLUMN) -> (int, int, int):
+    """
+    Works out the number of cases in the last 7 days, current hospital cases and the total number
+    of deaths from csv rows ordered newest first. Stops reading as soon as all three are known
+
+    :param rows: dictionaries of the csv rows keyed by the header names
+    :type: list
+    :param cases_column: header of the new cases column
+    :type: str
+    :param hospital_column: header of the hospital cases column
+    :type: str
+    :param deaths_column: header of the cumulative deaths column
+    :type: str
+
+    :return: The three variables as specified
+    :rtype: (int, int, int)
+    """
+    from covid_timeseries import CovidTimeSeries, SKIPPED_DAYS
+    needed_rows = []
+    hospital_found = deaths_found = False
+    for row in rows:
+        needed_rows.append(row)
+        # The latest hospital and deaths values are the newest ones that aren't blank
+        hospital_found = hospital_found or bool(row[hospital_column])
+        deaths_found = deaths_found or bool(row[deaths_column])
+        if len(needed_rows) >= SKIPPED_DAYS + 7 and hospital_found and deaths_found:
+            break
+
+    return CovidTimeSeries.from_rows(needed_rows, cases_column, hospital_column, deaths_column).summary()
 
 
 # Process covid csv data
@@ -135,32 +314,22 @@ def process_covid_csv_data(covid_csv_data: list) -> (int, int, int):
     :return: The three variables as specified
     :rtype: (int, int, int)
     """
-    last7days_cases = 0
-
-    processed_list_of_data = []
-    total_deaths = 0
-    processed_list_of_data.clear()
-
-    for i in covid_csv_data:
-        processed_list_of_data.append(i.split(","))
-    processed_list_of_data.pop(0)
-    # Process for the last7days_cases
-    for i in range(2, 9):
-        last7days_cases += int(float(processed_list_of_data[i][6]))
-
-    # Process for the current_hospital_cases
-    current_hospital_cases = processed_list_of_data[0][5]
-    if current_hospital_cases == "":
-        current_hospital_cases = 0
-    else:
-        current_hospital_cases = int(float(processed_list_of_data[0][5]))
-
-    # Process for the total_deaths
-    for i in processed_list_of_data:
-        if i[4] == "":
-            continue
-        else:
-            total_deaths = int(float(i[4]))
-            break
+    return summarise_csv_rows(csv.DictReader(covid_csv_data))
+
+
+def process_covid_csv_file(csv_filename: str) -> (int, int, int):
+    """
+    Processes a covid csv file into the number of cases in the last 7 days, current hospital
+    cases and the total number of deaths, reading only as many rows as it needs
+
+    :param csv_filename: the name of the csv file
+    :type: str
 
-    return last7days_cases, current_hospital_cases, total_deaths
+    :return: The three variables as specified
+    :rtype: (int, int, int)
+    """
+    rows = iter_csv_rows(csv_filename)
+    try:
+        return summarise_csv_rows(rows)
+    finally:
+        rows.close()
@@ -0,0 +1,225 @@
+"""
+This module keeps a local history of the covid data of each area, only downloading the days it doesn't have.
+Each area has its own file so a sync only rewrites the areas it changed
+"""
+
+# Imports
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from json import load
+from urllib.parse import quote
+from covid_data_handling import covid_api_request
+from http_session import MAX_HOST_CONNECTIONS
+from state_persistence import file_lock, replace_json
+from instrumentation import FILE_LOAD_SECONDS
+from records import CovidRecord
+
+HISTORY_DIR = 'covid_history'
+# Most recent days downloaded again on each sync as their figures are still being revised
+REVISED_DAYS = 2
+# Most single day requests made for a sync before it downloads the pages instead
+MAX_DAY_REQUESTS = 7
+
+
+def history_key(location: str, location_type: str) -> str:
+    """
+    Gets the key of an area in the history
+
+    :param location: The specified location
+    :type: str
+    :param location_type: The location type
+    :type: str
+
+    :returns: The key
+    :rtype: str
+    """
+    return f"{location_type}/{location}"
+
+
+def history_filename(location: str, location_type: str, directory: str = HISTORY_DIR) -> str:
+    """
+    Gets the JSON file of an area's history
+
+    :param location: The specified location
+    :type: str
+    :param location_type: The location type
+    :type: str
+    :param directory: The directory of the history files
+    :type: str
+
+    :returns: The file name
+    :rtype: str
+    """
+    # Area names can have characters that aren't allowed in file names
+    return os.path.join(directory, f"{quote(history_key(location, location_type), safe='')}.json")
+
+
+def load_entry(filename: str) -> dict:
+    """
+    Loads the history of an area, an empty history is returned if there isn't one yet
+
+    :param filename: The JSON file of the area's history
+    :type: str
+
+    :returns: Dictionary of {"last_date": date, "data": rows newest first}
+    :rtype: dict
+    """
+    try:
+        with FILE_LOAD_SECONDS.time(file='covid_history'), open(filename, 'r') as file:
+            return load(file)
+    except (OSError, ValueError):
+        return {"last_date": None, "data": []}
+
+
+def history_rows(location: str, location_type: str, directory: str = HISTORY_DIR) -> list:
+    """
+    Gets every stored row of an area's history
+
+    :param location: The specified location
+    :type: str
+    :param location_type: The location type
+    :type: str
+    :param directory: The directory of the history files
+    :type: str
+
+    :returns: The rows, newest first
+    :rtype: list
+    """
+    return load_entry(history_filename(location, location_type, directory))['data']
+
+
+def merge_rows(filename: str, new_rows: list) -> list:
+    """
+    Adds rows to the history of an area, replacing stored rows of the same day. The file is locked
+    from the read to the write so syncs running at the same time don't lose each other's rows, and
+    it is only rewritten if a row changed
+
+    :param filename: The JSON file of the area's history
+    :type: str
+    :param new_rows: The downloaded rows
+    :type: list
+
+    :returns: The rows that are new or differ from the stored ones, newest first
+    :rtype: list
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with file_lock(filename):
+        entry = load_entry(filename)
+        merged = {row['date']: CovidRecord.of(row) for row in entry['data']}
+        changed = [record for record in map(CovidRecord.from_dict, new_rows) if merged.get(record.date) != record]
+        if changed:
+            merged.update((record.date, record) for record in changed)
+            data = sorted(merged.values(), key=lambda row: row['date'], reverse=True)
+            replace_json(filename, {"last_date": data[0]['date'], "data": data})
+    return sorted(changed, key=lambda row: row['date'], reverse=True)
+
+
+def request_days(location: str, location_type: str, days: list) -> list:
+    """
+    Requests the data of single days, one request per day
+
+    :param location: The specified location
+    :type: str
+    :param location_type: The location type
+    :type: str
+    :param days: The YYYY-MM-DD dates
+    :type: list
+
+    :returns: The rows of the days that have data
+    :rtype: list
+    """
+    with ThreadPoolExecutor(max_workers=min(len(days), MAX_HOST_CONNECTIONS)) as pool:
+        pages = pool.map(lambda day: covid_api_request(location, location_type, date=day)['data'], days)
+        return [row for page in pages for row in page]
+
+
+def request_pages(location: str, location_type: str, since: str = None) -> list:
+    """
+    Requests the pages of an area's data, newest first, until they reach a date
+
+    :param location: The specified location
+    :type: str
+    :param location_type: The location type
+    :type: str
+    :param since: Stop once a page has a row on or before this YYYY-MM-DD date, None gets everything
+    :type: str
+
+    :returns: The rows newer than since
+    :rtype: list
+    """
+    rows = []
+    page = 1
+    while True:
+        response = covid_api_request(location, location_type, page=page)
+        rows.extend(row for row in response['data'] if since is None or row['date'] > since)
+        reached = since is not None and any(row['date'] <= since for row in response['data'])
+        if reached or not response['data'] or not (response.get('pagination') or {}).get('next'):
+            return rows
+        page += 1
+
+
+def sync_area(location: str, location_type: str, directory: str = HISTORY_DIR, today: date = None) -> list:
+    """
+    Brings the history of an area up to date. Only the days after the last synced day are
+    downloaded, along with the most recent days which are still being revised
+
+    :param location: The specified location
+    :type: str
+    :param location_type: The location type
+    :type: str
+    :param directory: The directory of the history files
+    :type: str
+    :param today: The current date
+    :type: date
+
+    :returns: The rows that are new or were revised since the last sync, newest first
+    :rtype: list
+    """
+    today = today or date.today()
+    filename = history_filename(location, location_type, directory)
+    entry = load_entry(filename)
+
+    if entry['last_date'] is None:
+        new_rows = request_pages(location, location_type)
+    else:
+        since = date.fromisoformat(entry['last_date']) - timedelta(days=REVISED_DAYS)
+        days = [(since + timedelta(days=i)).isoformat() for i in range(1, (today - since).days + 1)]
+        if len(days) <= MAX_DAY_REQUESTS:
+            new_rows = request_days(location, location_type, days)
+        else:
+            new_rows = request_pages(location, location_type, since.isoformat())
+
+    # The downloads happen outside the lock, the merge is against the file as it is now
+    changed = merge_rows(filename, new_rows)
+    logging.info(f"Synced {len(new_rows)} days of covid data for {location}, {len(changed)} new or revised")
+    return changed
+
+
+def sync_areas(areas: list, directory: str = HISTORY_DIR) -> dict:
+    """
+    Brings the history of many areas up to date at once. Areas that fail to sync are logged
+    and left out of the result
+
+    :param areas: list of (location, location_type) pairs
+    :type: list
+    :param directory: The directory of the history files
+    :type: str
+
+    :returns: Dictionary of {"data": new or revised rows newest first} keyed by (location, location_type)
+    :rtype: dict
+    """
+    areas = list(dict.fromkeys(tuple(area) for area in areas))
+    if not areas:
+        return {}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(len(areas), MAX_HOST_CONNECTIONS)) as pool:
+        futures = {area: pool.submit(sync_area, area[0], area[1], directory) for area in areas}
+        for area, future in futures.items():
+            try:
+                results[area] = {"data": future.result()}
+            except Exception as area_err:
+                logging.error(f"{area_err}: Failed to sync covid data for {area[0]}")
+    return results
@@ -0,0 +1,192 @@
+"""
+This module holds the daily covid metrics of an area as NumPy columns
+"""
+
+# Imports
+import numpy as np
+
+# Number of most recent days left out of the 7 day cases as they are incomplete
+SKIPPED_DAYS = 2
+
+
+def to_column(values: list) -> np.ndarray:
+    """
+    Converts a list of values into a float column, blank and missing values become NaN
+
+    :param values: list of numbers, numeric strings, '' or None
+    :type: list
+
+    :returns: The column
+    :rtype: np.ndarray
+    """
+    return np.array([np.nan if value is None or value == '' else float(value) for value in values], dtype=float)
+
+
+class CovidTimeSeries:
+    """Daily cases, hospital cases and cumulative deaths of an area, stored oldest first"""
+
+    def __init__(self, area_name: str, dates: list, cases: list, hospital: list, deaths: list):
+        """
+        Initialisation function for the class, the lists are ordered oldest first
+
+        :param area_name: Name of the area
+        :type: str
+        :param dates: The dates as YYYY-MM-DD strings
+        :type: list
+        :param cases: New cases on each date
+        :type: list
+        :param hospital: Hospital cases on each date
+        :type: list
+        :param deaths: Cumulative deaths on each date
+        :type: list
+        """
+        self.area_name = area_name
+        self.dates = np.array(dates, dtype='datetime64[D]')
+        self.columns = {"cases": to_column(cases),
+                        "hospital": to_column(hospital),
+                        "deaths": to_column(deaths)}
+
+    @classmethod
+    def from_rows(cls, rows: list, cases_key: str, hospital_key: str, deaths_key: str,
+                  area_name: str = '') -> 'CovidTimeSeries':
+        """
+        Makes a time series from dictionary rows ordered newest first, as given by the api and csv exports
+
+        :param rows: list of dictionaries of each day
+        :type: list
+        :param cases_key: key of the new cases
+        :type: str
+        :param hospital_key: key of the hospital cases
+        :type: str
+        :param deaths_key: key of the cumulative deaths
+        :type: str
+        :param area_name: Name of the area, taken from the rows if they have an areaName
+        :type: str
+
+        :returns: The time series
+        :rtype: CovidTimeSeries
+        """
+        rows = rows[::-1]
+        if not area_name and rows:
+            area_name = rows[-1].get('areaName') or ''
+        return cls(area_name,
+                   [row['date'] for row in rows],
+                   [row[cases_key] for row in rows],
+                   [row[hospital_key] for row in rows],
+                   [row[deaths_key] for row in rows])
+
+    @classmethod
+    def from_api_rows(cls, rows: list) -> 'CovidTimeSeries':
+        """
+        Makes a time series from the data rows of a covid api response
+
+        :param rows: list of dictionaries of each day, newest first
+        :type: list
+
+        :returns: The time series
+        :rtype: CovidTimeSeries
+        """
+        return cls.from_rows(rows, "newCasesByPublishDate", "hospitalCases", "cumDeaths28DaysByDeathDate")
+
+    def __len__(self) -> int:
+        """
+        Gets the number of days in the time series
+
+        :returns: The number of days
+        :rtype: int
+        """
+        return len(self.dates)
+
+    def rolling_sum(self, column: str, window: int = 7) -> np.ndarray:
+        """
+        Sums each day with the days before it, missing values count as 0
+
+        :param column: cases, hospital or deaths
+        :type: str
+        :param window: Number of days in each sum
+        :type: int
+
+        :returns: The sums, the first window - 1 days are NaN
+        :rtype: np.ndarray
+        """
+        totals = np.concatenate(([0.0], np.cumsum(np.nan_to_num(self.columns[column]))))
+        sums = np.full(len(self), np.nan)
+        if len(self) >= window:
+            sums[window - 1:] = totals[window:] - totals[:-window]
+        return sums
+
+    def window_sum(self, column: str, window: int = 7, skipped_days: int = SKIPPED_DAYS) -> int:
+        """
+        Sums the most recent days of a column, leaving out the incomplete days at the end
+
+        :param column: cases, hospital or deaths
+        :type: str
+        :param window: Number of days summed
+        :type: int
+        :param skipped_days: Number of most recent days left out
+        :type: int
+
+        :returns: The sum
+        :rtype: int
+        """
+        end = len(self) - skipped_days
+        return int(np.nansum(self.columns[column][max(end - window, 0):max(end, 0)]))
+
+    def rate(self, column: str, population: float, per: float = 100000.0, window: int = 7) -> np.ndarray:
+        """
+        Gets the rolling sums of a column per a number of people
+
+        :param column: cases, hospital or deaths
+        :type: str
+        :param population: Population of the area
+        :type: float
+        :param per: Number of people the rate is given for
+        :type: float
+        :param window: Number of days in each sum
+        :type: int
+
+        :returns: The rates
+        :rtype: np.ndarray
+        """
+        return self.rolling_sum(column, window) / population * per
+
+    def week_on_week(self, column: str = "cases", window: int = 7) -> np.ndarray:
+        """
+        Gets the change in each rolling sum compared to the one a window before
+
+        :param column: cases, hospital or deaths
+        :type: str
+        :param window: Number of days in each sum
+        :type: int
+
+        :returns: Fractional change, NaN where there is no earlier week or it was 0
+        :rtype: np.ndarray
+        """
+        sums = self.rolling_sum(column, window)
+        change = np.full(len(self), np.nan)
+        previous = sums[:-window]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change[window:] = np.where(previous > 0, sums[window:] / previous - 1, np.nan)
+        return change
+
+    def last_value(self, column: str) -> int:
+        """
+        Gets the most recent value of a column that isn't missing
+
+        :param column: cases, hospital or deaths
+        :type: str
+
+        :returns: The value or 0 if every value is missing
+        :rtype: int
+        """
+        present = np.flatnonzero(~np.isnan(self.columns[column]))
+        return int(self.columns[column][present[-1]]) if len(present) else 0
+
+    def summary(self) -> (int, int, int):
+        """
+        Gets the number of cases in the last 7 days, current hospital cases and the total number of deaths
+
+        :returns: The three variables as specified
+        :rtype: (int, int, int)
+        """
+        return self.window_sum("cases"), self.last_value("hospital"), self.last_value("deaths")
@@ -0,0 +1,119 @@
+"""
+This module keeps the last rendered dashboard page so repeat requests are served from memory, and
+the version of the state that caches like it are checked against
+"""
+
+# Imports
+import logging
+import os
+import time
+from hashlib import md5
+from json import load
+from threading import Lock
+from state_persistence import atomic_write_json, file_signature
+from instrumentation import CACHE_REQUESTS
+
+
+class StateVersion:
+    """A version number of some state, moved on each time the state changes"""
+
+    def __init__(self, shared_filename: str = None):
+        """
+        Initialisation function for the class
+
+        :param shared_filename: File rewritten on every change so the versions in other worker processes
+            move on too, None if there is only one process
+        :type: str
+        """
+        self.lock = Lock()
+        self.version = 0
+        # Time of the last change, sent as Last-Modified
+        self.changed = time.time()
+        self.shared_filename = shared_filename
+        self.shared_signature = None
+
+    def invalidate(self) -> None:
+        """
+        Moves the version on, so anything built from the state is out of date
+
+        :rtype: None
+        """
+        with self.lock:
+            self.version += 1
+            self.changed = time.time()
+            if self.shared_filename is not None:
+                atomic_write_json(self.shared_filename, {"pid": os.getpid(), "time": self.changed})
+                self.shared_signature = file_signature(self.shared_filename)
+
+    def check_shared(self) -> int:
+        """
+        Picks up a change made by another worker, must be called with the lock held
+
+        :returns: The current version of the state
+        :rtype: int
+        """
+        if self.shared_filename is not None:
+            signature = file_signature(self.shared_filename)
+            if signature != self.shared_signature:
+                self.shared_signature = signature
+                self.version += 1
+                # Every worker, and the workers after a restart, give the same time of the change
+                try:
+                    with open(self.shared_filename, 'r') as file:
+                        self.changed = float(load(file)['time'])
+                except (OSError, ValueError, KeyError, TypeError):
+                    self.changed = time.time()
+        return self.version
+
+    def state(self) -> (int, float):
+        """
+        Gets the version of the state and the time it last changed, for responses cached outside the snapshot
+
+        :returns: The version and the time of the change
+        :rtype: (int, float)
+        """
+        with self.lock:
+            return self.check_shared(), self.changed
+
+
+class DashboardSnapshot(StateVersion):
+    """The rendered dashboard page and its ETag, rebuilt only after the state changes"""
+
+    def __init__(self, shared_filename: str = None):
+        """
+        Initialisation function for the class
+
+        :param shared_filename: File rewritten on every change so snapshots in other worker processes
+            are rebuilt too, None if there is only one process
+        :type: str
+        """
+        super().__init__(shared_filename)
+        self.html = None
+        self.etag = None
+        self.built_version = -1
+
+    def get(self, build) -> (str, str):
+        """
+        Gets the page, rebuilding it with build() if the state has changed since it was last built
+
+        :param build: function that renders the page and returns its html
+        :type: function
+
+        :returns: The html of the page and its ETag
+        :rtype: (str, str)
+        """
+        with self.lock:
+            version = self.check_shared()
+            if self.built_version == version:
+                CACHE_REQUESTS.inc(cache='dashboard', result='hit')
+                return self.html, self.etag
+        CACHE_REQUESTS.inc(cache='dashboard', result='miss')
+
+        # Built outside the lock, a change made while building leaves the snapshot out of date
+        html = build()
+        etag = md5(html.encode()).hexdigest()
+        with self.lock:
+            if version > self.built_version:
+                self.html, self.etag, self.built_version = html, etag, version
+        logging.info("Dashboard snapshot rebuilt")
+        return html, etag
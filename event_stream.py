@@ -0,0 +1,162 @@
+"""
+This module pushes changes to the browsers with Server-Sent Events, so they don't have to keep
+reloading the page to see new data
+"""
+
+# Imports
+import logging
+import time
+from collections import deque
+from json import dumps
+from queue import Queue, Empty, Full
+from threading import Lock
+from records import to_json
+
+# Seconds between the comments sent to keep idle connections open
+HEARTBEAT_INTERVAL = 15.0
+
+
+def format_event(event: str, data: object, event_id: int = None) -> str:
+    """
+    Formats an event in the text/event-stream format
+
+    :param event: Name of the event
+    :type: str
+    :param data: The data of the event, sent as JSON
+    :type: object
+    :param event_id: Id the browser sends back as Last-Event-ID when it reconnects
+    :type: int
+
+    :returns: The formatted event
+    :rtype: str
+    """
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {event}")
+    lines.append(f"data: {dumps(data, separators=(',', ':'), default=to_json)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """The queue of events waiting to be sent to one browser"""
+
+    def __init__(self, queue_size: int):
+        """
+        Initialisation function for the class
+
+        :param queue_size: Most events waiting before the browser is dropped
+        :type: int
+        """
+        self.queue = Queue(maxsize=queue_size)
+        self.closed = False
+
+
+class EventBroker:
+    """
+    Sends each published event to every open stream. Recent events are kept so a browser that
+    reconnects gets the ones it missed. The ids are the millisecond the event was published, so an id
+    from another worker or from before a restart still marks how far the browser got
+    """
+
+    def __init__(self, history_size: int = 100, queue_size: int = 100):
+        """
+        Initialisation function for the class
+
+        :param history_size: Number of recent events kept for reconnecting browsers
+        :type: int
+        :param queue_size: Most events waiting for one browser before it is dropped
+        :type: int
+        """
+        self.lock = Lock()
+        self.last_id = 0
+        self.history = deque(maxlen=history_size)
+        self.queue_size = queue_size
+        self.subscriptions = set()
+
+    def publish(self, event: str, data: object) -> int:
+        """
+        Sends an event to every open stream. A browser too slow to keep up is dropped, it reconnects
+        and gets the events it missed from the history
+
+        :param event: Name of the event
+        :type: str
+        :param data: The data of the event
+        :type: object
+
+        :returns: The id of the event
+        :rtype: int
+        """
+        with self.lock:
+            # Two events in the same millisecond still get increasing ids
+            self.last_id = max(self.last_id + 1, int(time.time() * 1000))
+            message = format_event(event, data, self.last_id)
+            self.history.append((self.last_id, message))
+            for subscription in list(self.subscriptions):
+                try:
+                    subscription.queue.put_nowait(message)
+                except Full:
+                    subscription.closed = True
+                    self.subscriptions.discard(subscription)
+            return self.last_id
+
+    def subscribe(self, last_event_id: int = None) -> Subscription:
+        """
+        Opens a subscription, queueing the events after last_event_id that are still in the history
+
+        :param last_event_id: Id of the last event the browser got, None for only new events
+        :type: int
+
+        :returns: The subscription
+        :rtype: Subscription
+        """
+        subscription = Subscription(self.queue_size)
+        with self.lock:
+            if last_event_id is not None:
+                for event_id, message in self.history:
+                    if event_id > last_event_id and not subscription.queue.full():
+                        subscription.queue.put_nowait(message)
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Closes a subscription
+
+        :param subscription: The subscription
+        :type: Subscription
+
+        :rtype: None
+        """
+        with self.lock:
+            subscription.closed = True
+            self.subscriptions.discard(subscription)
+
+    def stream(self, last_event_id: int = None, heartbeat: float = HEARTBEAT_INTERVAL, idle=None):
+        """
+        Generator of the text of an event stream, runs until the browser disconnects or is dropped
+
+        :param last_event_id: Id of the last event the browser got
+        :type: int
+        :param heartbeat: Seconds between keep-alive comments when there are no events
+        :type: float
+        :param idle: function called on each heartbeat, returning a list of extra (event, data) to send
+        :type: function
+
+        :returns: Generator of the event stream text
+        :rtype: generator
+        """
+        subscription = self.subscribe(last_event_id)
+        try:
+            # Tells the browser how long to wait before reconnecting
+            yield f"retry: {int(heartbeat * 1000)}\n\n"
+            while True:
+                try:
+                    yield subscription.queue.get(timeout=heartbeat)
+                except Empty:
+                    if subscription.closed:
+                        logging.info("Dropped an event stream that fell behind")
+                        return
+                    for event, data in (idle() if idle is not None else []):
+                        yield format_event(event, data)
+                    yield f": {time.time()}\n\n"
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,124 @@
+"""
+This module holds the shared HTTP session used for all the api requests
+"""
+
+# Imports
+import logging
+import time
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlsplit
+from resilience import CircuitBreaker, backoff_delay
+
+# Most requests allowed to a single host at once
+MAX_HOST_CONNECTIONS = 8
+# Number of times a failed request is retried and the base delay between tries in seconds
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+# Failed requests in a row before a host's circuit opens, and seconds before it is tried again
+BREAKER_THRESHOLD = 3
+BREAKER_RESET = 60.0
+# Status codes that are worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# One keep-alive connection pool shared by every request, made on the first request
+session = None
+
+host_limits = {}
+host_breakers = {}
+host_limits_lock = Lock()
+
+
+def get_session() -> object:
+    """
+    Gets the shared session, making it the first time. Requests is imported here as it is slow to
+    import and the website should start without waiting for it
+
+    :returns: The session
+    :rtype: requests.Session
+    """
+    global session
+    with host_limits_lock:
+        if session is None:
+            from requests import Session
+            from requests.adapters import HTTPAdapter
+            new_session = Session()
+            new_session.mount('https://', HTTPAdapter(pool_maxsize=MAX_HOST_CONNECTIONS))
+            new_session.mount('http://', HTTPAdapter(pool_maxsize=MAX_HOST_CONNECTIONS))
+            session = new_session
+        return session
+
+
+def host_limit(url: str) -> BoundedSemaphore:
+    """
+    Gets the semaphore limiting the number of requests to the host of a url
+
+    :param url: The url being requested
+    :type: str
+
+    :returns: The semaphore for the host
+    :rtype: BoundedSemaphore
+    """
+    host = urlsplit(url).netloc
+    with host_limits_lock:
+        return host_limits.setdefault(host, BoundedSemaphore(MAX_HOST_CONNECTIONS))
+
+
+def host_breaker(url: str) -> CircuitBreaker:
+    """
+    Gets the circuit breaker of the host of a url
+
+    :param url: The url being requested
+    :type: str
+
+    :returns: The circuit breaker for the host
+    :rtype: CircuitBreaker
+    """
+    host = urlsplit(url).netloc
+    with host_limits_lock:
+        if host not in host_breakers:
+            host_breakers[host] = CircuitBreaker(host, BREAKER_THRESHOLD, BREAKER_RESET)
+        return host_breakers[host]
+
+
+def api_get(url: str, params: dict = None, headers: dict = None, timeout: float = 10) -> object:
+    """
+    Makes a GET request over the shared session, retrying connection errors and busy responses
+    after a jittered exponential backoff. Once a host keeps failing its circuit opens and
+    requests to it raise CircuitOpenError straight away
+
+    :param url: The url being requested
+    :type: str
+    :param params: The query parameters
+    :type: dict
+    :param headers: Extra request headers
+    :type: dict
+    :param timeout: Seconds to wait for the response
+    :type: float
+
+    :returns: The response of the last try
+    :rtype: object
+    """
+    from requests.exceptions import ConnectionError, Timeout
+    breaker = host_breaker(url)
+    breaker.before_call()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with host_limit(url):
+                response = get_session().get(url, params=params, headers=headers, timeout=timeout)
+        except (ConnectionError, Timeout) as request_err:
+            if attempt == MAX_RETRIES:
+                breaker.record_failure()
+                raise
+            logging.error(f"{request_err}: Retrying request to {url}")
+        except Exception:
+            breaker.record_failure()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            if attempt == MAX_RETRIES:
+                breaker.record_failure()
+                return response
+            logging.error(f"Request to {url} returned {response.status_code}, retrying")
+        time.sleep(backoff_delay(attempt, RETRY_BACKOFF))
@@ -0,0 +1,243 @@
+"""
+This module has the counters and histograms timing the hot paths of the data hub, served in the
+Prometheus text format on /metrics, and an optional profiler for single requests
+"""
+
+# Imports
+import cProfile
+import logging
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+# Upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Every metric, in the order they are served
+REGISTRY = []
+
+
+def format_labels(labels: dict) -> str:
+    """
+    Formats labels in the Prometheus text format
+
+    :param labels: The label names and values
+    :type: dict
+
+    :returns: The labels in braces, '' if there are none
+    :rtype: str
+    """
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class Counter:
+    """A count that only goes up, one for each combination of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry: list = REGISTRY):
+        """
+        Initialisation function for the class
+
+        :param name: Name of the metric
+        :type: str
+        :param documentation: Help text of the metric
+        :type: str
+        :param labelnames: Names of the labels
+        :type: tuple
+        :param registry: The list of metrics it is served with
+        :type: list
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.lock = Lock()
+        self.values = {}
+        registry.append(self)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """
+        Adds to the count
+
+        :param amount: Amount added
+        :type: float
+
+        :rtype: None
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> list:
+        """
+        Gets the samples of the metric
+
+        :returns: list of (name, labels, value)
+        :rtype: list
+        """
+        with self.lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self.values.items()]
+
+
+class Histogram(Counter):
+    """Counts of observed values in cumulative buckets, with their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS,
+                 registry: list = REGISTRY):
+        """
+        Initialisation function for the class
+
+        :param name: Name of the metric
+        :type: str
+        :param documentation: Help text of the metric
+        :type: str
+        :param labelnames: Names of the labels
+        :type: tuple
+        :param buckets: Upper bounds of the buckets
+        :type: tuple
+        :param registry: The list of metrics it is served with
+        :type: list
+        """
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        Adds a value
+
+        :param value: The value, usually seconds
+        :type: float
+
+        :rtype: None
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            counts = self.values.setdefault(key, [0] * len(self.buckets) + [0, 0.0])
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Context manager, also usable as a decorator, that observes the seconds its block takes
+
+        :returns: Context manager
+        :rtype: object
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list:
+        """
+        Gets the bucket, count and sum samples of the metric
+
+        :returns: list of (name, labels, value)
+        :rtype: list
+        """
+        samples = []
+        with self.lock:
+            for key, counts in self.values.items():
+                labels = dict(zip(self.labelnames, key))
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", dict(labels, le=repr(bound)), count))
+                samples.append((f"{self.name}_bucket", dict(labels, le='+Inf'), counts[-2]))
+                samples.append((f"{self.name}_count", labels, counts[-2]))
+                samples.append((f"{self.name}_sum", labels, counts[-1]))
+        return samples
+
+
+def render_metrics(registry: list = REGISTRY) -> str:
+    """
+    Formats every metric in the Prometheus text format
+
+    :param registry: The list of metrics
+    :type: list
+
+    :returns: The metrics
+    :rtype: str
+    """
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{format_labels(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+UPSTREAM_SECONDS = Histogram('datahub_upstream_request_seconds', 'Seconds taken by the covid and news api calls',
+                             ('call',))
+UPSTREAM_ERRORS = Counter('datahub_upstream_errors_total', 'Failed covid and news api requests', ('api',))
+REFRESH_SECONDS = Histogram('datahub_refresh_seconds', 'Seconds taken by dump_data and dump_news', ('kind',))
+FILE_LOAD_SECONDS = Histogram('datahub_file_load_seconds', 'Seconds taken loading the JSON files', ('file',))
+TEMPLATE_SECONDS = Histogram('datahub_template_render_seconds', 'Seconds taken rendering templates',
+                             ('template',))
+CACHE_REQUESTS = Counter('datahub_cache_requests_total', 'Cache lookups by whether they were hits',
+                         ('cache', 'result'))
+SCHEDULER_LAG = Histogram('datahub_scheduler_lag_seconds', 'Seconds scheduled events ran after they were due')
+HTTP_SECONDS = Histogram('datahub_http_request_seconds', 'Seconds taken serving requests',
+                         ('endpoint', 'method', 'status'))
+
+
+class RequestProfiler:
+    """
+    Profiles requests with cProfile and saves each profile to a directory, for viewing with pstats
+    or snakeviz. Only one request is profiled at a time, the others run as normal
+    """
+
+    def __init__(self, directory: str):
+        """
+        Initialisation function for the class
+
+        :param directory: Directory the .prof files are saved to
+        :type: str
+        """
+        self.directory = directory
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self) -> cProfile.Profile:
+        """
+        Starts profiling the current request
+
+        :returns: The profile, None if another request is being profiled
+        :rtype: cProfile.Profile
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile: cProfile.Profile, name: str) -> str:
+        """
+        Stops profiling and saves the profile
+
+        :param profile: The profile from start()
+        :type: cProfile.Profile
+        :param name: Name of what was profiled, used in the file name
+        :type: str
+
+        :returns: The file name of the profile
+        :rtype: str
+        """
+        try:
+            profile.disable()
+            filename = os.path.join(self.directory, f"{time.time():.6f}-{name}.prof")
+            profile.dump_stats(filename)
+            logging.info(f"Saved request profile {filename}")
+            return filename
+        finally:
+            self.lock.release()
@@ -0,0 +1,371 @@
+"""
+This module keeps the scheduled updates in a JSON file so they survive restarts. Each update has
+an absolute due time, and repeating updates move on to the same time the next day. Single updates
+added or removed are saved in the background, so each one doesn't rewrite the whole file
+"""
+
+# Imports
+import heapq
+import logging
+import time
+from operator import attrgetter
+from datetime import datetime, timedelta
+from threading import RLock, Timer
+from state_persistence import JsonStateFile
+from instrumentation import SCHEDULER_LAG
+from records import ScheduledUpdate
+
+JOBS_FILE = 'scheduled_updates.json'
+# Out of date index entries allowed for each update before the index is rebuilt
+INDEX_SLACK = 2
+
+
+def next_due(alarm: str, after: float) -> float:
+    """
+    Gets the next time a 24hr clock time comes round
+
+    :param alarm: 24hr clock time, HH:MM
+    :type: str
+    :param after: The due time is after this time
+    :type: float
+
+    :returns: The due time in seconds since the epoch
+    :rtype: float
+    """
+    hour, minute = (int(part) for part in alarm.split(':'))
+    due = datetime.fromtimestamp(after).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    # Whole days are added to the local time so the update keeps its clock time over daylight saving changes
+    while due.timestamp() <= after:
+        due += timedelta(days=1)
+    return due.timestamp()
+
+
+def load_updates(data: dict) -> dict:
+    """
+    Converts the updates loaded from the JSON file into records
+
+    :param data: Dictionary of update dictionaries keyed by title
+    :type: dict
+
+    :returns: Dictionary of ScheduledUpdate records keyed by title
+    :rtype: dict
+    """
+    return {title: ScheduledUpdate.of(job) for title, job in data.items()}
+
+
+def write_pending(jobs: dict, pending: dict) -> list:
+    """
+    Makes the changes waiting to be saved to a dictionary of updates
+
+    :param jobs: Dictionary of ScheduledUpdate records keyed by title, changed in place
+    :type: dict
+    :param pending: Dictionary of the updates added keyed by title, None for the ones removed
+    :type: dict
+
+    :returns: An empty list, the changes are already in the index
+    :rtype: list
+    """
+    for title, job in pending.items():
+        if job is None:
+            jobs.pop(title, None)
+        else:
+            jobs[title] = job
+    return []
+
+
+class JobStore:
+    """
+    The scheduled updates, saved in a JSON file and indexed by due time with a heap. It has the
+    run(blocking=False) method of sched.scheduler so the scheduler service runs it like the other queues
+    """
+
+    def __init__(self, filename: str = JOBS_FILE, on_due=None, save_delay: float = 1.0):
+        """
+        Initialisation function for the class
+
+        :param filename: The JSON file of the updates
+        :type: str
+        :param on_due: function called with each update when it comes up
+        :type: function
+        :param save_delay: Seconds to wait after adding or removing an update before saving, so
+            bursts of changes are saved once
+        :type: float
+        """
+        self.file = JsonStateFile(filename, default={}, decode=load_updates)
+        self.on_due = on_due
+        self.save_delay = save_delay
+        self.lock = RLock()
+        self.save_timer = None
+        # Heap of (due, title), entries whose update has since changed or gone are skipped
+        self.heap = []
+        # The file data the updates were last built from
+        self.indexed = None
+        # The updates of the file with the unsaved changes made, and the unsaved changes keyed by
+        # title, None for an update removed
+        self.view = {}
+        self.pending = {}
+
+    def jobs(self) -> dict:
+        """
+        Gets the updates, rebuilding the index if the file was changed by another process. The
+        dictionary is changed in place by add() and remove(), hold the lock to loop over it
+
+        :returns: Dictionary of ScheduledUpdate records keyed by title
+        :rtype: dict
+        """
+        with self.lock:
+            data = self.file.read()
+            if data is not self.indexed:
+                self.view = dict(data)
+                write_pending(self.view, self.pending)
+                self.heap = [(job.due, title) for title, job in self.view.items()]
+                heapq.heapify(self.heap)
+                self.indexed = data
+            return self.view
+
+    def change(self, change) -> dict:
+        """
+        Changes the updates in the file, keeping the index in step. Any unsaved changes are saved
+        in the same write
+
+        :param change: function given a copy of the updates to change in place, returning the
+            (due, title) entries to add to the index. The updates are ScheduledUpdate records
+        :type: function
+
+        :returns: The updates
+        :rtype: dict
+        """
+        with self.lock:
+            self.jobs()
+            pending = self.pending
+            entries = []
+            stale = []
+
+            def change_jobs(data):
+                # The file was reloaded for the update if another process changed it
+                stale.append(self.file.snapshot[1] is not self.indexed)
+                write_pending(data, pending)
+                entries.extend(change(data))
+
+            data = self.file.update(change_jobs)
+            self.pending = {}
+            if stale[0]:
+                self.indexed = None
+                return self.jobs()
+            for entry in entries:
+                heapq.heappush(self.heap, entry)
+            self.view = dict(data)
+            self.indexed = data
+            self.compact()
+            return self.view
+
+    def compact(self) -> None:
+        """
+        Rebuilds the index once it is mostly entries of changed or removed updates
+
+        :rtype: None
+        """
+        with self.lock:
+            if len(self.heap) > INDEX_SLACK * len(self.view) + 64:
+                self.heap = [(job.due, title) for title, job in self.view.items()]
+                heapq.heapify(self.heap)
+
+    def schedule_save(self) -> None:
+        """
+        Saves the unsaved changes after save_delay seconds unless a save is already waiting
+
+        :rtype: None
+        """
+        with self.lock:
+            if self.save_timer is not None:
+                return
+            self.save_timer = Timer(self.save_delay, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def save(self) -> None:
+        """
+        Writes the unsaved changes to the file
+
+        :rtype: None
+        """
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            if self.pending:
+                self.change(lambda jobs: [])
+
+    def add(self, update: ScheduledUpdate, now: float = None) -> ScheduledUpdate:
+        """
+        Adds an update, replacing any update with the same title. It is saved within save_delay seconds
+
+        :param update: The update or its dictionary, its alarm is a 24hr clock time
+        :type: ScheduledUpdate
+        :param now: The current time
+        :type: float
+
+        :returns: The update with its due time
+        :rtype: ScheduledUpdate
+        """
+        update = ScheduledUpdate.of(update)
+        job = update.replace(due=next_due(update.alarm, now or time.time()))
+        with self.lock:
+            self.jobs()[job.title] = job
+            self.pending[job.title] = job
+            heapq.heappush(self.heap, (job.due, job.title))
+            self.compact()
+        self.schedule_save()
+        logging.info(f"Update {job.title} due at {time.ctime(job.due)}")
+        return job
+
+    def apply(self, adds: list, removes: list, now: float = None) -> (int, int):
+        """
+        Removes and adds many updates in one write of the file, removals first. Nothing is
+        changed if any of the updates has an invalid alarm
+
+        :param adds: list of updates or their dictionaries, replacing updates with the same titles
+        :type: list
+        :param removes: list of titles of the updates removed
+        :type: list
+        :param now: The current time
+        :type: float
+
+        :returns: The number of updates added and the number removed
+        :rtype: (int, int)
+        """
+        now = now or time.time()
+        new_jobs = [ScheduledUpdate.of(update) for update in adds]
+        new_jobs = [job.replace(due=next_due(job.alarm, now)) for job in new_jobs]
+        removed = []
+
+        def apply_changes(jobs):
+            removed.extend(title for title in removes if jobs.pop(title, None) is not None)
+            jobs.update((job.title, job) for job in new_jobs)
+            return [(job.due, job.title) for job in new_jobs]
+
+        self.change(apply_changes)
+        logging.info(f"Added {len(new_jobs)} and removed {len(removed)} updates")
+        return len(new_jobs), len(removed)
+
+    def remove(self, title: str) -> bool:
+        """
+        Removes an update
+
+        :param title: Title of the update
+        :type: str
+
+        :returns: True if the update was found
+        :rtype: bool
+        """
+        with self.lock:
+            if self.jobs().pop(title, None) is None:
+                return False
+            self.pending[title] = None
+        self.schedule_save()
+        return True
+
+    def get(self, title: str) -> ScheduledUpdate:
+        """
+        Gets an update
+
+        :param title: Title of the update
+        :type: str
+
+        :returns: The update, None if there isn't one with the title
+        :rtype: ScheduledUpdate
+        """
+        return self.jobs().get(title)
+
+    def updates(self) -> list:
+        """
+        Gets the updates in the order they are due
+
+        :returns: list of ScheduledUpdate records
+        :rtype: list
+        """
+        with self.lock:
+            return sorted(self.jobs().values(), key=attrgetter('due'))
+
+    def peek(self) -> tuple:
+        """
+        Gets the next update to come up, dropping index entries that are out of date
+
+        :returns: (due, title) of the update, None if there are no updates
+        :rtype: tuple
+        """
+        with self.lock:
+            jobs = self.jobs()
+            while self.heap and getattr(jobs.get(self.heap[0][1]), 'due', None) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            return self.heap[0] if self.heap else None
+
+    def claim_due(self, now: float) -> list:
+        """
+        Takes every update that is due in one write, so only one process runs each of them.
+        A repeating update moves on to its next time after now, so runs missed while the
+        website was down only happen once
+
+        :param now: The current time
+        :type: float
+
+        :returns: list of the updates taken, with the due times they were taken at
+        :rtype: list
+        """
+        with self.lock:
+            jobs = self.jobs()
+            candidates = []
+            while self.heap and self.heap[0][0] <= now:
+                due, title = heapq.heappop(self.heap)
+                if getattr(jobs.get(title), 'due', None) == due:
+                    candidates.append((due, title))
+            if not candidates:
+                return []
+
+            claimed = []
+
+            def take(data):
+                entries = []
+                for due, title in candidates:
+                    job = data.get(title)
+                    # Another process already took it
+                    if job is None or job.due != due:
+                        continue
+                    claimed.append(job)
+                    if job.repeat:
+                        data[title] = job.replace(due=next_due(job.alarm, max(due, now)))
+                        entries.append((data[title].due, title))
+                    else:
+                        del data[title]
+                return entries
+
+            self.change(take)
+            return claimed
+
+    def run(self, blocking: bool = False) -> float:
+        """
+        Runs every update that is due, like sched.scheduler.run(blocking=False)
+
+        :param blocking: Not supported, the scheduler service does the waiting
+        :type: bool
+
+        :returns: Seconds until the next update is due, None if there are none
+        :rtype: float
+        """
+        while True:
+            now = time.time()
+            for job in self.claim_due(now):
+                SCHEDULER_LAG.observe(now - job.due)
+                logging.info(f"Running update {job.title}, due at {time.ctime(job.due)}")
+                try:
+                    if self.on_due is not None:
+                        self.on_due(job)
+                except Exception as run_err:
+                    logging.error(f"{run_err}: Update {job.title} failed")
+
+            entry = self.peek()
+            if entry is None:
+                return None
+            # Updates still due were changed by another process while they were being taken
+            if entry[0] > now:
+                return max(entry[0] - time.time(), 0)
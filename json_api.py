@@ -0,0 +1,163 @@
+"""
+This module builds the bodies of the JSON api, keeping each one and its compressed copies
+until the state changes so repeat polls don't serialise or compress anything again
+"""
+
+# Imports
+import gzip
+from collections import OrderedDict
+from hashlib import md5
+from json import dumps
+from threading import Lock
+from instrumentation import CACHE_REQUESTS
+from records import to_json
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional, responses are only gzipped without it
+    brotli = None
+
+# Seconds browsers and shared caches such as CDNs may reuse a response without revalidating it
+API_MAX_AGE = 60
+API_SHARED_MAX_AGE = 300
+# Bodies smaller than this are sent uncompressed as compressing them saves next to nothing
+MIN_COMPRESS_SIZE = 512
+# Most bodies kept for each version of the state, so unique query strings can't use up the memory
+API_CACHE_SIZE = 256
+
+
+def select_fields(records: list, fields: str = None) -> list:
+    """
+    Keeps only some of the fields of each record
+
+    :param records: list of dictionaries
+    :type: list
+    :param fields: Comma separated field names, None or '' keeps every field
+    :type: str
+
+    :returns: The records with only the selected fields
+    :rtype: list
+    """
+    if not fields:
+        return records
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    return [{name: record[name] for name in names if name in record} for record in records]
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """
+    Picks the compression to use from an Accept-Encoding header, brotli first if it is installed
+
+    :param accept_encoding: The Accept-Encoding header of the request
+    :type: str
+
+    :returns: 'br', 'gzip' or None for no compression
+    :rtype: str
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+class ApiBody:
+    """A serialised JSON body with its ETag and compressed copies made as they are asked for"""
+
+    def __init__(self, data: object):
+        """
+        Initialisation function for the class
+
+        :param data: The data sent as JSON
+        :type: object
+        """
+        self.body = dumps(data, separators=(',', ':'), default=to_json).encode()
+        self.etag = md5(self.body).hexdigest()
+        self.lock = Lock()
+        self.encoded = {None: self.body}
+
+    def encode(self, encoding: str) -> (bytes, str):
+        """
+        Gets the body compressed with an encoding
+
+        :param encoding: 'br', 'gzip' or None
+        :type: str
+
+        :returns: The body and the encoding actually used, None if it wasn't compressed
+        :rtype: (bytes, str)
+        """
+        if len(self.body) < MIN_COMPRESS_SIZE:
+            encoding = None
+        with self.lock:
+            if encoding not in self.encoded:
+                if encoding == 'br':
+                    self.encoded[encoding] = brotli.compress(self.body)
+                else:
+                    self.encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+            return self.encoded[encoding], encoding
+
+
+class ApiCache:
+    """
+    The bodies of the JSON api, all dropped once the state changes. Only the most recently used
+    max_size bodies are kept
+    """
+
+    def __init__(self, max_size: int = API_CACHE_SIZE):
+        """
+        Initialisation function for the class
+
+        :param max_size: Most bodies kept
+        :type: int
+        """
+        self.lock = Lock()
+        self.max_size = max_size
+        self.version = None
+        self.bodies = OrderedDict()
+
+    def get(self, key: tuple, version: int, build) -> ApiBody:
+        """
+        Gets a body, building it with build() if it isn't cached for this version of the state
+
+        :param key: The path and query of the request
+        :type: tuple
+        :param version: The version of the state
+        :type: int
+        :param build: function returning the data of the body
+        :type: function
+
+        :returns: The body
+        :rtype: ApiBody
+        """
+        with self.lock:
+            if self.version != version:
+                self.version = version
+                self.bodies = OrderedDict()
+            body = self.bodies.get(key)
+            if body is not None:
+                self.bodies.move_to_end(key)
+        if body is not None:
+            CACHE_REQUESTS.inc(cache='api', result='hit')
+            return body
+        CACHE_REQUESTS.inc(cache='api', result='miss')
+
+        body = ApiBody(build())
+        with self.lock:
+            if self.version == version:
+                self.bodies[key] = body
+                if len(self.bodies) > self.max_size:
+                    self.bodies.popitem(last=False)
+        return body
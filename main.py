@@ -3,20 +3,66 @@ This module is the main module for the program and runs the website
 """
 
 # Imports
-from json import dump
-from datetime import datetime, timedelta
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
 from flask import (
-    Flask, render_template, request
+    Flask, Response, render_template, request, make_response, g
+)
+from covid_data_handling import fetch_areas, data_scheduler
+from news_data_handling import news_api_request, news_scheduler
+from article_store import ArticleStore
+from article_search import ArticleIndex
+from dashboard_snapshot import DashboardSnapshot, StateVersion
+from scheduler_service import SchedulerService, TimedScheduler
+from job_store import JobStore
+from area_scheduler import AreaScheduler, configured_areas
+from records import ScheduledUpdate
+from covid_history import sync_areas, history_rows
+from metrics_store import MetricsStore
+from state_persistence import JsonStateFile
+from refresh_coordinator import RefreshCoordinator
+from refresh_pipeline import SingleFlight
+from json_api import ApiCache, select_fields, choose_encoding, API_MAX_AGE, API_SHARED_MAX_AGE
+from event_stream import EventBroker
+from instrumentation import (
+    REFRESH_SECONDS, TEMPLATE_SECONDS, HTTP_SECONDS, RequestProfiler, render_metrics
 )
-from covid_data_handling import *
-from news_data_handling import *
 
 # Main setup
 FORMAT = '%(levelname)s: %(asctime)s %(message)s'
-logging.basicConfig(filename='pysys.log', level=logging.INFO, format=FORMAT)
+LOG_FILE = 'pysys.log'
+
+# Seconds between each worker checking for refresh requests and whether the refresh leader has gone
+COORDINATOR_POLL = 5.0
 
-main_scheduler = scheduler(time.time, time.sleep)
+main_scheduler = TimedScheduler(time.time, time.sleep)
 app = Flask(__name__)
+dashboard = DashboardSnapshot()
+api_cache = ApiCache()
+# Version of the data of every area, so refreshing an area not on the page only drops the area api bodies
+area_versions = StateVersion()
+area_api_cache = ApiCache()
+# Pushes changes to the open pages
+event_broker = EventBroker()
+news_store = ArticleStore('covid_news.json', on_save=lambda: dashboard.invalidate())
+metrics_store = MetricsStore('covid_data.db')
+# Search index of every article in the metrics store
+article_index = ArticleIndex()
+config_file = JsonStateFile('config.json')
+# Only the elected worker runs dump_data and dump_news
+coordinator = RefreshCoordinator('refresh.lock', 'refresh_requests.json')
+# Refreshes triggered while the same refresh is running share its result instead of fetching again
+refreshes = SingleFlight()
+coordinator.register('data', lambda: refreshes.run('data', dump_data))
+coordinator.register('news', lambda: refreshes.run('news', dump_news))
+# The scheduled updates, kept in a file so they survive restarts
+job_store = JobStore('scheduled_updates.json', on_due=lambda update: run_update(update))
+# Refreshes the areas in the config file a few at a time, each on its own interval
+area_scheduler = AreaScheduler(config_file.read, lambda areas: refresh_shards(areas))
+# Runs the scheduled updates off the request path
+scheduler_service = SchedulerService([data_scheduler, news_scheduler, job_store, area_scheduler, main_scheduler])
 
 
 class Covid19DataHub:
@@ -32,43 +78,229 @@ class Covid19DataHub:
         self.total_deaths = 0
         self.national_location = ""
         self.current_articles = []
-        self.update_content = []
         self.deleted_titles = []
-        self.time_arr = []
-
-        # Updates the JSON files on initialisation
-        dump_news()
-        dump_data()
 
     def render_app(self) -> object:
         """
-        Gets the covid data and news, also renders the website template with all the data
+        Serves the website from the dashboard snapshot, only rendering it again if the data,
+        news or updates have changed. Browsers that already have the page get a 304
 
-        :returns: Renders index.html to the host server
+        :returns: The response with index.html
         :rtype: object
         """
+        html, etag = dashboard.get(self.build_page)
+        response = make_response(html)
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    def build_page(self) -> str:
+        """
+        Gets the covid data and news, also renders the website template with all the data
 
-        main_scheduler.run(blocking=False)
-        data_scheduler.run(blocking=False)
-        news_scheduler.run(blocking=False)
+        :returns: The rendered index.html
+        :rtype: str
+        """
 
         # Gets the data and news variables
         self.get_data()
         self.get_news()
 
         # Renders the template of the website with all the data
-        return render_template('index.html',
-                               title='Covid19 DataHub',
-                               local_7day_infections=self.local_7day_cases,
-                               location=self.local_location,
-                               nation_loaction=self.national_location,
-                               national_7day_infections=self.nat_7day_cases,
-                               hospital_cases=self.hospital_cases,
-                               deaths_total=self.total_deaths,
-                               news_articles=self.current_articles,
-                               notification=self.current_articles,
-                               updates=self.update_content,
-                               alarm=self.update_content)
+        with TEMPLATE_SECONDS.time(template='index.html'):
+            return render_template('index.html',
+                                   title='Covid19 DataHub',
+                                   local_7day_infections=self.local_7day_cases,
+                                   location=self.local_location,
+                                   nation_location=self.national_location,
+                                   national_7day_infections=self.nat_7day_cases,
+                                   hospital_cases=self.hospital_cases,
+                                   deaths_total=self.total_deaths,
+                                   news_articles=self.current_articles,
+                                   areas=configured_areas(config_file.read()),
+                                   notification=self.current_articles,
+                                   updates=job_store.updates(),
+                                   alarm=job_store.updates())
+
+    def json_response(self, build, versions: DashboardSnapshot = None, cache: ApiCache = None) -> object:
+        """
+        Serves a JSON api response from the api cache, compressed if the client accepts it.
+        Clients that already have the response get a 304
+
+        :param build: function returning the data of the response
+        :type: function
+        :param versions: The state the response is built from, the dashboard by default
+        :type: StateVersion
+        :param cache: The api cache of that state, api_cache by default
+        :type: ApiCache
+
+        :returns: The JSON response
+        :rtype: object
+        """
+        versions, cache = versions or dashboard, cache or api_cache
+        version, changed = versions.state()
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        body = cache.get(key, version, build)
+        data, encoding = body.encode(choose_encoding(request.headers.get('Accept-Encoding')))
+
+        response = make_response(data)
+        response.mimetype = 'application/json'
+        # Each encoding is a different representation so it needs its own ETag
+        response.set_etag(body.etag if encoding is None else f"{body.etag}-{encoding}")
+        response.last_modified = changed
+        response.cache_control.public = True
+        response.cache_control.max_age = API_MAX_AGE
+        response.cache_control.s_maxage = API_SHARED_MAX_AGE
+        response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.content_encoding = encoding
+        return response.make_conditional(request)
+
+    def api_areas(self) -> object:
+        """
+        Serves the summary of every area in the metrics store
+
+        :returns: JSON list of areas
+        :rtype: object
+        """
+        def build():
+            areas = [area_summary(area_name, area_type) for area_name, area_type in metrics_store.areas()]
+            return select_fields(areas, request.args.get('fields'))
+
+        return self.json_response(build, area_versions, area_api_cache)
+
+    def api_area_summary(self, area_type: str, area_name: str) -> object:
+        """
+        Serves the summary of one area, used by the page when another area is picked. The fields
+        argument keeps only some of its fields
+
+        :param area_type: Type of the area
+        :type: str
+        :param area_name: Name of the area
+        :type: str
+
+        :returns: JSON of the area summary
+        :rtype: object
+        """
+        def build():
+            return select_fields([area_summary(area_name, area_type)], request.args.get('fields'))[0]
+
+        return self.json_response(build, area_versions, area_api_cache)
+
+    def api_area(self, area_type: str, area_name: str) -> object:
+        """
+        Serves the records of an area, newest first. The start, end and limit arguments narrow them down
+
+        :param area_type: Type of the area
+        :type: str
+        :param area_name: Name of the area
+        :type: str
+
+        :returns: JSON list of records
+        :rtype: object
+        """
+        def build():
+            rows = metrics_store.area_history(area_name, area_type, request.args.get('start'),
+                                              request.args.get('end'), request.args.get('limit', type=int))
+            return select_fields(rows, request.args.get('fields'))
+
+        return self.json_response(build, area_versions, area_api_cache)
+
+    def api_articles(self) -> object:
+        """
+        Serves the news articles, only the ones on the page if the visible argument is given
+
+        :returns: JSON list of articles
+        :rtype: object
+        """
+        def build():
+            if request.args.get('visible') is not None:
+                articles = news_store.current()
+            else:
+                articles = news_store.all_articles()
+            return select_fields(articles, request.args.get('fields'))
+
+        return self.json_response(build)
+
+    def api_article_search(self) -> object:
+        """
+        Searches the stored news articles published in the last 30 days for the words in the q
+        argument, best matches first. The limit argument is the most articles returned, 10 by default
+
+        :returns: JSON list of articles
+        :rtype: object
+        """
+        def build():
+            # Picks up articles stored by the refresh leader in another worker
+            article_index.sync(metrics_store)
+            articles = article_index.search(request.args.get('q', ''), request.args.get('limit', 10, type=int))
+            return select_fields(articles, request.args.get('fields'))
+
+        return self.json_response(build)
+
+    def metrics(self) -> object:
+        """
+        Serves the timings and counts of this worker in the Prometheus text format
+
+        :returns: The metrics response
+        :rtype: object
+        """
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    def event_stream(self) -> object:
+        """
+        Streams the changes to the data, news and updates as Server-Sent Events
+
+        :returns: The text/event-stream response
+        :rtype: object
+        """
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        idle = None
+        if dashboard.shared_filename is not None:
+            seen = {"version": dashboard.state()[0], "last_id": event_broker.last_id}
+
+            def idle():
+                # Changes made by another worker only show up here as a new version of the state
+                version = dashboard.state()[0]
+                changed = version != seen['version'] and event_broker.last_id == seen['last_id']
+                seen.update(version=version, last_id=event_broker.last_id)
+                return [('changed', {})] if changed else []
+
+        response = Response(event_broker.stream(last_event_id, idle=idle), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Stops proxies such as nginx holding the events back
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    def api_updates(self) -> object:
+        """
+        Adds and removes many updates in one request without rendering the page. The JSON body is
+        {"add": [update, ...], "remove": [title, ...]}, each update has a title and a 24hr clock
+        alarm and may set repeat, data and news to true
+
+        :returns: JSON of the number of updates added, removed and scheduled, or the error with a 400
+        :rtype: object
+        """
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return {"error": "Expected a JSON object"}, 400
+        add, remove = body.get('add', []), body.get('remove', [])
+        # A string or object would otherwise be taken one character or key at a time
+        if not isinstance(add, list) or not all(isinstance(update, dict) for update in add):
+            return {"error": "Expected add to be a list of updates"}, 400
+        if not isinstance(remove, list) or not all(isinstance(title, str) for title in remove):
+            return {"error": "Expected remove to be a list of titles"}, 400
+        try:
+            adds = [batch_update(update) for update in add]
+            added, removed = job_store.apply(adds, remove)
+        except (AttributeError, KeyError, TypeError, ValueError) as batch_err:
+            return {"error": f"Invalid update: {batch_err}"}, 400
+
+        scheduler_service.wake()
+        dashboard.invalidate()
+        updates = job_store.updates()
+        event_broker.publish('updates', {"updates": [{"title": update.title, "content": update.content}
+                                                     for update in updates]})
+        return {"added": added, "removed": removed, "updates": len(updates)}
 
     def app_updates(self) -> object:
         """
@@ -78,37 +310,31 @@ class Covid19DataHub:
         :rtype: object
         """
 
-        # Makes a dictionary of the update content
-        update_dict = {"title": request.args.get("two"), "content": "", "alarm": request.args.get("update"),
-                       "repeat": False, "data": False, "news": False, "already_repeated": True}
         repeat = request.args.get("repeat")
         data = request.args.get("covid-data")
         news = request.args.get('news')
+        alarm = request.args.get("update")
 
         news_pop = request.args.get("notif")
         update_pop = request.args.get("update_item")
 
-        if news is not None:
-            update_dict["news"] = True
-        if data is not None:
-            update_dict["data"] = True
-        if repeat is not None:
-            update_dict["repeat"] = True
-            update_dict["already_repeated"] = False
-
-        update_dict["content"] = f"{update_dict['alarm']} {repeat} {data} {news}"
+        # Makes the record of the update content
+        update = ScheduledUpdate(request.args.get("two"), f"{alarm} {repeat} {data} {news}", alarm,
+                                 repeat is not None, data is not None, news is not None)
 
         # Adds the update to scheduler if there is a title in the content
         # There must be a title to the content or there shouldn't be an update
-        if update_dict["title"] is not None:
+        if update.title is not None:
             # Checks if the user submitted a time
             # If not it returns back to index
-            if update_dict['alarm'] == '':
+            if update.alarm == '':
                 logging.info("Invalid time submitted")
                 return self.render_app()
 
-            self.update_content.append(update_dict)
-            self.update_scheduler(dict(update_dict))
+            self.update_scheduler(update)
+            scheduler_service.wake()
+            dashboard.invalidate()
+            event_broker.publish('update-added', {"title": update.title, "content": update.content})
             logging.info("Schedulers Updated")
 
         # Pops articles
@@ -118,75 +344,23 @@ class Covid19DataHub:
 
         # Pops updates
         if update_pop is not None:
-            self.pop_updates(update_pop, True)
+            self.pop_updates(update_pop)
             logging.info(f"Update {update_pop} removed from scheduler")
 
         return self.render_app()
 
-    def pop_updates(self, title: str, popping: bool = False) -> None:
+    def pop_updates(self, title: str) -> None:
         """
-        This function is used to remove updates from the scheduler
+        This function is used to remove updates from the job store
 
         :param title: title of the update
         :type: str
-        :param popping: Whether or not the user wants to completely remove the update
-        :type: bool
 
         :rtype: None
         """
-        # Loops through all the schedulers and deletes the events which match with the time and the title
-        for i in self.time_arr:
-            # i[0] is the time
-            # i[1] is True if it's not a repeated time
-            try:
-                for k in data_scheduler.queue:
-                    data_repeated = i[1]
-                    if k[3][0] == title:
-                        if popping:
-                            data_scheduler.cancel(k)
-                        else:
-                            if k[0] == i[0] and data_repeated is True:
-                                data_scheduler.cancel(k)
-            except Exception as data_err:
-                logging.error(f"{data_err}: Error when deleting data schedules")
-
-            try:
-                for k in news_scheduler.queue:
-                    news_repeated = i[1]
-                    if k[3][0] == title:
-                        if popping:
-                            news_scheduler.cancel(k)
-                        else:
-                            if k[0] == i[0] and news_repeated is True:
-                                data_scheduler.cancel(k)
-            except Exception as news_err:
-                logging.error(f"{news_err}: Error when deleting news schedules")
-
-            try:
-                for k in main_scheduler.queue:
-                    main_repeated = i[1]
-                    if k[3][0] == title:
-                        if popping:
-                            main_scheduler.cancel(k)
-                        else:
-                            if k[0] == i[0] and main_repeated is True:
-                                main_scheduler.cancel(k)
-                            else:
-                                # If the time is repeated, it sets i[1] to True
-                                i[1] = True
-            except Exception as main_err:
-                logging.error(f"{main_err}: Error when deleting main schedules")
-
-        # Pops the updates from the website column
-        try:
-            for i in self.update_content:
-                if i['title'] == title:
-                    if i['already_repeated'] or popping:
-                        self.update_content.remove(i)
-                    else:
-                        i['already_repeated'] = True
-        except Exception as update_err:
-            logging.error(f"{update_err}: Error when deleting the update content")
+        if job_store.remove(title):
+            event_broker.publish('update-removed', {"title": title})
+            dashboard.invalidate()
 
     def pop_articles(self, title: str) -> None:
         """
@@ -197,113 +371,91 @@ class Covid19DataHub:
 
         :rtype: None
         """
-        with open('covid_news.json', 'r') as file:
-            all_articles = load(file)
-
-        for i in self.current_articles:
-            if i['title'] == title:
-                self.deleted_titles.append(i)
-                all_articles.remove(i)
-                # Adds the new articles to self.current_articles
-                self.current_articles.clear()
-                for j in range(4):
-                    self.current_articles.append(all_articles[j])
-                with open('covid_news.json', 'w') as file:
-                    dump(all_articles, file)
-
-    def update_scheduler(self, update_dictionary: dict) -> None:
+        # The store moves the next article into the gap and saves the change in the background
+        if news_store.remove(title):
+            self.deleted_titles.append(title)
+            dashboard.invalidate()
+            event_broker.publish('article-removed', {"title": title, "articles": article_delta()})
+        self.current_articles = news_store.current()
+
+    def update_scheduler(self, update: ScheduledUpdate) -> None:
         """
-        This function adds new events to schedulers
+        This function adds an update to the job store, which runs it when it comes up
 
-        :param update_dictionary: dictionary of the update content
-        :type: dict
+        :param update: The update or its dictionary
+        :type: ScheduledUpdate
 
         :rtype: None
         """
-
-        # List of the functions used
-        functions = []
-        if update_dictionary['news']:
-            functions.append(self.get_news)
-        if update_dictionary['data']:
-            functions.append(self.get_data)
-        functions.append(self.pop_updates)
-
-        if update_dictionary['repeat'] and not update_dictionary["already_repeated"]:
-            # Adds the repeated time to the schedulers
-            alarm_time = format_time(update_dictionary['alarm'], True)
-            # Adds to schedulers depending on the function
-            for i in functions:
-                if i == self.pop_updates:
-                    main_scheduler.enter(alarm_time, priority=1, action=i,
-                                         argument=(update_dictionary['title'],))
-                elif i == self.get_news:
-                    update_news(alarm_time, update_dictionary['title'])
-                else:
-                    schedule_covid_updates(alarm_time, update_dictionary['title'])
-
-            # Adds the alarm_time and the title to the time_arr
-            # This is useful for popping the updates later
-            self.time_arr.append([alarm_time, update_dictionary['already_repeated']])
-            # Does the function again but this time it won't go through the repeated step
-            update_dictionary['already_repeated'] = True
-
-            logging.info(f"Update added at {alarm_time} with {functions}")
-            self.update_scheduler(update_dictionary)
-        else:
-            alarm_time = format_time(update_dictionary['alarm'])
-            # Adds to schedulers depending on the function
-            for i in functions:
-                if i == self.pop_updates:
-                    main_scheduler.enter(alarm_time, priority=1, action=i,
-                                         argument=(update_dictionary['title'],))
-                elif i == self.get_news:
-                    update_news(alarm_time, update_dictionary['title'])
-                else:
-                    schedule_covid_updates(alarm_time, update_dictionary['title'])
-
-            self.time_arr.append([alarm_time, update_dictionary['already_repeated']])
-            logging.info(f"Update added at {alarm_time} with {functions}")
+        job_store.add(update)
 
     def get_data(self) -> None:
         """
-        Gets the data from the JSON file
+        Gets the data of the locations in the config file from the metrics store
 
         :rtype: None
         """
-        with open('covid_data.json', 'r') as file:
-            data = load(file)
-            logging.info("Getting data from JSON file")
-        self.local_7day_cases = data[0][0]
-        self.local_location = data[1]
-        self.nat_7day_cases, self.hospital_cases, self.total_deaths = data[2]
-        self.national_location = data[3]
+        logging.info("Getting data from the metrics store")
+        data = data_delta()
+        self.local_7day_cases, self.local_location = data['local_7day_infections'], data['location']
+        self.nat_7day_cases, self.national_location = data['national_7day_infections'], data['nation_location']
+        self.hospital_cases, self.total_deaths = data['hospital_cases'], data['deaths_total']
 
     def get_news(self) -> None:
         """
-        Gets the news from the JSON file and returns the 4 currently used articles
+        Gets the 4 currently used articles from the article store
 
         :returns: None
         """
-        with open('covid_news.json', 'r') as file:
-            all_articles = load(file)
-            logging.info("Getting news from JSON file")
-        used_articles = []
+        self.current_articles = news_store.current()
+
+
+def data_delta() -> dict:
+    """
+    Gets the data shown on the page for the locations in the config file, keyed by the template variables
+
+    :returns: The data
+    :rtype: dict
+    """
+    cfg = config_file.read()
+    (local_cases, _, _), location = metrics_store.area_summary(cfg['local_location'], cfg['local_location_type'])
+    (national_cases, hospital, deaths), nation_location = \
+        metrics_store.area_summary(cfg['national_location'], cfg['national_location_type'])
+    return {"location": location, "local_7day_infections": local_cases, "nation_location": nation_location,
+            "national_7day_infections": national_cases, "hospital_cases": hospital, "deaths_total": deaths}
+
+
+def area_summary(area_name: str, area_type: str) -> dict:
+    """
+    Gets the summary of an area served by the JSON api
+
+    :param area_name: Name of the area
+    :type: str
+    :param area_type: Type of the area
+    :type: str
 
-        with open('config.json', 'r') as config_file:
-            cfg = load(config_file)
-        with open('config.json', 'w') as config_file:
-            cfg['deleted_titles'] = []
-            dump(cfg, config_file)
+    :returns: The area name and type, cases in the last 7 days, hospital cases and total deaths
+    :rtype: dict
+    """
+    (cases, hospital, deaths), _ = metrics_store.area_summary(area_name, area_type)
+    return {"areaName": area_name, "areaType": area_type, "last7DaysCases": cases,
+            "hospitalCases": hospital, "totalDeaths": deaths}
 
-        for i in range(4):
-            used_articles.append(all_articles[i])
-        self.current_articles = used_articles
 
+def article_delta() -> list:
+    """
+    Gets the articles shown on the page with only the fields the page uses
 
+    :returns: list of {"title", "content"} dictionaries
+    :rtype: list
+    """
+    return [{"title": article['title'], "content": article.get('content')} for article in news_store.current()]
+
+
+@REFRESH_SECONDS.time(kind='news')
 def dump_news(s: str = None) -> None:
     """
-    Dumps news articles into a JSON file
+    Dumps news articles into the article store, which saves them to a JSON file
 
     :param s: Update title - parameter not used
     :type: str
@@ -314,81 +466,261 @@ def dump_news(s: str = None) -> None:
     try:
         all_articles = news_api_request()['articles']
     except Exception as api_err:
+        # The last good articles are kept until the api recovers
         logging.error(f"{api_err}: Failed to update news")
-        all_articles = []
+        return
+
+    news_store.replace(all_articles)
+    metrics_store.upsert_articles(all_articles)
+    # Only the articles new to the store are indexed
+    article_index.sync(metrics_store)
+    dashboard.invalidate()
+    event_broker.publish('news', {"articles": article_delta()})
 
-    with open('covid_news.json', 'w') as file:
-        dump(all_articles, file)
-        logging.info("Updating news")
 
+def refresh_areas(areas: list) -> list:
+    """
+    Dumps the covid data of some areas into the metrics store. Areas that fail to update keep
+    their previous records
+
+    :param areas: list of (location, location_type) pairs
+    :type: list
 
+    :returns: list of the (location, location_type) pairs that were updated
+    :rtype: list
+    """
+    cfg = config_file.read()
+    try:
+        # Incremental sync only downloads the days missing from the local history
+        if cfg.get('incremental_sync'):
+            areas_data = sync_areas(areas)
+            # The history files are the source of truth, a new database gets the whole history of each
+            # area instead of only the rows that just changed
+            for area, area_data in areas_data.items():
+                if not metrics_store.has_area(*area):
+                    area_data['data'] = history_rows(*area)
+        else:
+            areas_data = fetch_areas(areas)
+    except Exception as data_err:
+        logging.error(f"{data_err}: Failed to update data")
+        areas_data = {}
+
+    # Only areas whose records actually changed invalidate anything
+    changed = [area for area, area_data in areas_data.items() if metrics_store.upsert_records(area_data['data'])]
+    logging.info(f"Updated the data of {len(areas_data)} areas, {len(changed)} changed")
+    if not changed:
+        return list(areas_data)
+
+    area_versions.invalidate()
+    shown = {(cfg['local_location'], cfg['local_location_type']),
+             (cfg['national_location'], cfg['national_location_type'])}
+    if shown.intersection(changed):
+        dashboard.invalidate()
+        event_broker.publish('data', data_delta())
+    # Pages showing another area they picked fetch its summary again
+    event_broker.publish('areas', {"areas": [{"areaName": name, "areaType": area_type} for name, area_type in changed]})
+    return list(areas_data)
+
+
+@REFRESH_SECONDS.time(kind='data')
 def dump_data(s: str = None) -> None:
     """
-    Dumps covid data into a JSON file using the locations specified in the config file
+    Dumps the covid data of the local and national locations into the metrics store straight away.
+    The other areas in the config file are left to the area scheduler, on their own intervals
 
     :param s: Update title, parameter not used
     :type: str
 
     :returns: None
     """
-    with open('config.json', 'r') as file:
-        cfg = load(file)
+    cfg = config_file.read()
+    areas = [(cfg['local_location'], cfg['local_location_type']),
+             (cfg["national_location"], cfg["national_location_type"])]
+    area_scheduler.mark_refreshed(refresh_areas(areas))
 
-    try:
-        all_data = [process_json_data(covid_api_request(cfg['local_location'], cfg['local_location_type'])['data']),
-                    covid_api_request(cfg['local_location'], cfg['local_location_type'])['data'][0]['areaName'],
-                    process_json_data(covid_api_request(cfg["national_location"],
-                                                        cfg["national_location_type"])['data']),
-                    covid_api_request(cfg["national_location"], cfg["national_location_type"])['data'][0]['areaName']]
-    except Exception as data_err:
-        logging.error(f"{data_err}: Failed to update data")
-        all_data = [[0, 0, 0], '', [0, 0, 0], '']
 
-    with open('covid_data.json', 'w') as file:
-        dump(all_data, file)
-        logging.info("Updating data")
+@REFRESH_SECONDS.time(kind='areas')
+def refresh_shards(areas: list) -> list:
+    """
+    Refreshes a batch of areas for the area scheduler. Only the refresh leader fetches them, the
+    other workers leave them to it
+
+    :param areas: list of (location, location_type) pairs
+    :type: list
+
+    :returns: list of the (location, location_type) pairs that were updated or left to the leader
+    :rtype: list
+    """
+    if not coordinator.try_lead():
+        return areas
+    return refresh_areas(areas)
+
+
+def batch_update(update: dict) -> ScheduledUpdate:
+    """
+    Makes the record of an update sent to the batch api, like the ones app_updates makes
+
+    :param update: The update with a title, alarm and optional repeat, data and news flags
+    :type: dict
+
+    :returns: The update
+    :rtype: ScheduledUpdate
+    """
+    repeat, data, news = bool(update.get('repeat')), bool(update.get('data')), bool(update.get('news'))
+    # The content is the same as for updates added on the page
+    content = f"{update['alarm']} {'repeat' if repeat else None} {'covid-data' if data else None} " \
+              f"{'news' if news else None}"
+    return ScheduledUpdate(str(update['title']), content, update['alarm'], repeat, data, news)
 
 
-def format_time(time_to_format: str, repeating: bool = False) -> float:
+def run_update(update: ScheduledUpdate) -> None:
     """
-    Formats 24hr time into seconds from the current time
+    Runs an update when it comes up. The job store has already moved a repeating update on to the
+    next day, or removed an update that doesn't repeat
+
+    :param update: The update
+    :type: ScheduledUpdate
+
+    :rtype: None
+    """
+    if update.news:
+        coordinator.request('news')
+    if update.data:
+        coordinator.request('data')
+    if not update.repeat:
+        event_broker.publish('update-removed', {"title": update.title})
+    dashboard.invalidate()
+
 
-    :param time_to_format: 24hr clock time of the update time
+def poll_coordinator() -> None:
+    """
+    Runs the refreshes other workers have asked for, or takes over if the refresh leader has gone,
+    then checks again after COORDINATOR_POLL seconds
+
+    :rtype: None
+    """
+    try:
+        coordinator.poll()
+    finally:
+        main_scheduler.enter(COORDINATOR_POLL, 1, poll_coordinator)
+
+
+def instrument_app(flask_app: Flask, profile_dir: str = None) -> None:
+    """
+    Times every request of an app, and profiles them if a directory is given for the profiles
+
+    :param flask_app: The app
+    :type: Flask
+    :param profile_dir: Directory the cProfile .prof file of each request is saved to, None to not profile
     :type: str
-    :param repeating: If the update should repeat or not
-    :type: bool
 
-    :returns: Alarm time in seconds from current time
-    :rtype: float
+    :rtype: None
+    """
+    profiler = RequestProfiler(profile_dir) if profile_dir else None
+
+    def start_request():
+        g.request_start = time.perf_counter()
+        g.profile = profiler.start() if profiler is not None else None
+
+    def finish_request(response):
+        HTTP_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint or 'unknown',
+                             method=request.method, status=response.status_code)
+        if g.profile is not None:
+            profiler.stop(g.profile, request.endpoint or 'unknown')
+            g.profile = None
+        return response
+
+    flask_app.before_request(start_request)
+    flask_app.after_request(finish_request)
+
+
+def warm_caches(server: Covid19DataHub) -> None:
+    """
+    Renders the page and indexes the articles saved by the last run, then updates the data and news
+
+    :param server: The website
+    :type: Covid19DataHub
+
+    :rtype: None
     """
+    with app.app_context():
+        dashboard.get(server.build_page)
+    article_index.sync(metrics_store)
+    coordinator.request('news')
+    coordinator.request('data')
+    logging.info("Caches warmed")
 
-    date = datetime.today().strftime("%Y-%m-%d")
-    tomorrow = (datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d")
 
-    current_time = time.time()
-    update_time = time.mktime(time.strptime(f"{date} {time_to_format}:00", "%Y-%m-%d %H:%M:%S"))
-    if current_time > update_time:
-        date = tomorrow
+def setup_logging(shared: bool) -> None:
+    """
+    Sends the log to pysys.log, rotated rather than cleared so the history of earlier runs is kept.
+    Worker processes log to stderr for the WSGI server to collect instead, as rotating one file from
+    many processes loses and mixes up lines
+
+    :param shared: True when running as one of many worker processes
+    :type: bool
 
-    if repeating:
-        alarms = time.mktime(time.strptime(f"{tomorrow} {time_to_format}:00", "%Y-%m-%d %H:%M:%S")) - time.time()
+    :rtype: None
+    """
+    if shared:
+        handler = logging.StreamHandler()
     else:
-        alarms = time.mktime(time.strptime(f"{date} {time_to_format}:00", "%Y-%m-%d %H:%M:%S")) - time.time()
-    return float(alarms)
+        handler = RotatingFileHandler(LOG_FILE, maxBytes=5_000_000, backupCount=3)
+    logging.basicConfig(handlers=[handler], level=logging.INFO, format=FORMAT)
 
 
-if __name__ == '__main__':
+def start_app(shared: bool = False, profile_dir: str = None, warm_start: bool = True) -> Flask:
+    """
+    Sets up the routes of the module's app and starts the scheduler service. The website serves the
+    data and news saved by the last run straight away, updating them in the background unless
+    warm_start is False. The app, its state and the services belong to the module, so this can only
+    be called once in each process
+
+    :param shared: True when running as one of many worker processes, so changes made by one
+        worker are seen by the others
+    :type: bool
+    :param profile_dir: Directory to save a cProfile profile of each request to, None to not profile
+    :type: str
+    :param warm_start: False to warm the caches before returning. Only the worker leading the refreshes
+        updates the data and news first, as slow as the apis are, other workers ask the leader to and
+        return straight away
+    :type: bool
+
+    :returns: The Flask app
+    :rtype: Flask
+    """
+    if scheduler_service.ident is not None:
+        raise RuntimeError("The website has already been started in this process")
+    setup_logging(shared)
+    if shared:
+        dashboard.shared_filename = 'dashboard_version.json'
+        area_versions.shared_filename = 'area_version.json'
+
     server = Covid19DataHub()
     app.add_url_rule('/', view_func=server.render_app)
     app.add_url_rule('/index/', view_func=server.app_updates)
-    # Clearing the 'pysys.log' file on use
-    # File is automatically created when the program is run
-    try:
-        with open('pysys.log', 'w') as f:
-            f.write('')
-    except Exception as e:
-        print(f"{e} file \"pysys.log\" does not exist")
-        pass
+    app.add_url_rule('/api/areas', view_func=server.api_areas)
+    app.add_url_rule('/api/areas/<area_type>/<area_name>', view_func=server.api_area)
+    app.add_url_rule('/api/areas/<area_type>/<area_name>/summary', view_func=server.api_area_summary)
+    app.add_url_rule('/api/articles', view_func=server.api_articles)
+    app.add_url_rule('/api/articles/search', view_func=server.api_article_search)
+    app.add_url_rule('/api/updates', view_func=server.api_updates, methods=['POST'])
+    app.add_url_rule('/events', view_func=server.event_stream)
+    app.add_url_rule('/metrics', view_func=server.metrics)
+    instrument_app(app, profile_dir)
+
+    if warm_start:
+        refreshes.start('warm', lambda: warm_caches(server))
+    else:
+        warm_caches(server)
 
+    main_scheduler.enter(COORDINATOR_POLL, 1, poll_coordinator)
+    scheduler_service.start()
     logging.info("Setup complete")
-    app.run(debug=True)
+    return app
+
+
+if __name__ == '__main__':
+    # The reloader would start the website in a parent process that never serves requests, leaving
+    # it leading the refreshes with the code it started with. Without it there is only one process
+    start_app(profile_dir=os.environ.get('DATAHUB_PROFILE_DIR')).run(debug=True, use_reloader=False)
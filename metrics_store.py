@@ -0,0 +1,289 @@
+"""
+This module stores the covid records and news articles in a local SQLite database
+"""
+
+# Imports
+import sqlite3
+from threading import Lock
+from records import CovidRecord
+
+DATABASE_FILE = 'covid_data.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS covid_records (
+    area_code TEXT NOT NULL,
+    area_name TEXT NOT NULL,
+    area_type TEXT NOT NULL,
+    date TEXT NOT NULL,
+    new_cases INTEGER,
+    hospital_cases INTEGER,
+    cum_deaths INTEGER,
+    PRIMARY KEY (area_code, date)
+);
+CREATE INDEX IF NOT EXISTS covid_records_area ON covid_records (area_name, area_type, date);
+CREATE TABLE IF NOT EXISTS news_articles (
+    url TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    content TEXT,
+    source TEXT,
+    published_at TEXT,
+    updated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS news_articles_published ON news_articles (published_at);
+CREATE INDEX IF NOT EXISTS news_articles_updated ON news_articles (updated);
+'''
+
+UPSERT_RECORD = '''
+INSERT INTO covid_records (area_code, area_name, area_type, date, new_cases, hospital_cases, cum_deaths)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (area_code, date) DO UPDATE SET
+    area_name = excluded.area_name, area_type = excluded.area_type, new_cases = excluded.new_cases,
+    hospital_cases = excluded.hospital_cases, cum_deaths = excluded.cum_deaths
+WHERE covid_records.area_name IS NOT excluded.area_name OR covid_records.area_type IS NOT excluded.area_type
+    OR covid_records.new_cases IS NOT excluded.new_cases OR covid_records.hospital_cases IS NOT excluded.hospital_cases
+    OR covid_records.cum_deaths IS NOT excluded.cum_deaths
+'''
+
+# Each part only reads the newest rows of the area through the (area_name, area_type, date) index
+AREA_SUMMARY = '''
+SELECT
+    (SELECT area_name FROM covid_records WHERE area_name = :name AND area_type = :type
+     ORDER BY date DESC LIMIT 1),
+    (SELECT COALESCE(SUM(new_cases), 0) FROM
+        (SELECT new_cases FROM covid_records WHERE area_name = :name AND area_type = :type
+         ORDER BY date DESC LIMIT :window OFFSET :skipped)),
+    (SELECT hospital_cases FROM covid_records WHERE area_name = :name AND area_type = :type
+     AND hospital_cases IS NOT NULL ORDER BY date DESC LIMIT 1),
+    (SELECT cum_deaths FROM covid_records WHERE area_name = :name AND area_type = :type
+     AND cum_deaths IS NOT NULL ORDER BY date DESC LIMIT 1)
+'''
+# Days in the cases total and the most recent days left out as they are incomplete, as in covid_timeseries
+SUMMARY_WINDOW = 7
+SUMMARY_SKIPPED_DAYS = 2
+
+# Each new or changed article takes the next number of the updated sequence, so readers can pick up
+# the articles changed in place as well as the new ones
+UPSERT_ARTICLE = '''
+INSERT INTO news_articles (url, title, description, content, source, published_at, updated)
+VALUES (?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(updated), 0) + 1 FROM news_articles))
+ON CONFLICT (url) DO UPDATE SET
+    title = excluded.title, description = excluded.description, content = excluded.content,
+    source = excluded.source, published_at = excluded.published_at, updated = excluded.updated
+WHERE news_articles.title IS NOT excluded.title OR news_articles.description IS NOT excluded.description
+    OR news_articles.content IS NOT excluded.content OR news_articles.source IS NOT excluded.source
+    OR news_articles.published_at IS NOT excluded.published_at
+'''
+
+
+class MetricsStore:
+    """SQLite store of the covid records, indexed by area and date, and the news articles"""
+
+    def __init__(self, filename: str = DATABASE_FILE):
+        """
+        Initialisation function for the class, the database is created on first use
+
+        :param filename: The database file
+        :type: str
+        """
+        self.filename = filename
+        self.lock = Lock()
+        self.connection = None
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Gets the connection to the database, opening it and creating the tables if needed
+
+        :returns: The connection
+        :rtype: sqlite3.Connection
+        """
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            # Readers in other processes aren't blocked by a write
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def upsert_records(self, rows: list) -> int:
+        """
+        Adds covid api rows to the store in one transaction, replacing rows of the same area and date.
+        Rows that are the same as the stored ones aren't written
+
+        :param rows: list of covid api rows
+        :type: list
+
+        :returns: The number of rows that were new or changed
+        :rtype: int
+        """
+        values = [(row.get('areaCode') or f"{row['areaType']}/{row['areaName']}", row['areaName'], row['areaType'],
+                   row['date'], row.get('newCasesByPublishDate'), row.get('hospitalCases'),
+                   row.get('cumDeaths28DaysByDeathDate')) for row in rows]
+        with self.lock:
+            connection = self.connect()
+            before = connection.total_changes
+            with connection:
+                connection.executemany(UPSERT_RECORD, values)
+            return connection.total_changes - before
+
+    def upsert_articles(self, articles: list) -> int:
+        """
+        Adds news articles to the store in one transaction, replacing articles with the same url.
+        Articles that are the same as the stored ones aren't written
+
+        :param articles: list of news articles
+        :type: list
+
+        :returns: The number of articles that were new or changed
+        :rtype: int
+        """
+        values = [(article.get('url') or article['title'], article['title'], article.get('description'),
+                   article.get('content'), (article.get('source') or {}).get('name'), article.get('publishedAt'))
+                  for article in articles]
+        with self.lock:
+            connection = self.connect()
+            before = connection.total_changes
+            with connection:
+                connection.executemany(UPSERT_ARTICLE, values)
+            return connection.total_changes - before
+
+    def area_history(self, area_name: str, area_type: str, start: str = None, end: str = None,
+                     limit: int = None) -> list:
+        """
+        Gets the records of an area in the covid api row format, newest first
+
+        :param area_name: Name of the area
+        :type: str
+        :param area_type: Type of the area
+        :type: str
+        :param start: First YYYY-MM-DD date included
+        :type: str
+        :param end: Last YYYY-MM-DD date included
+        :type: str
+        :param limit: Most rows returned
+        :type: int
+
+        :returns: list of covid records
+        :rtype: list
+        """
+        query = '''SELECT area_code, area_name, area_type, date, new_cases, hospital_cases, cum_deaths
+                   FROM covid_records WHERE area_name = ? AND area_type = ?'''
+        params = [area_name, area_type]
+        if start is not None:
+            query += ' AND date >= ?'
+            params.append(start)
+        if end is not None:
+            query += ' AND date <= ?'
+            params.append(end)
+        query += ' ORDER BY date DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        with self.lock:
+            rows = self.connect().execute(query, params).fetchall()
+        return [CovidRecord(*row) for row in rows]
+
+    def area_summary(self, area_name: str, area_type: str) -> ((int, int, int), str):
+        """
+        Gets the number of cases in the last 7 days, current hospital cases and the total number
+        of deaths of an area, along with the area name as the api gives it
+
+        :param area_name: Name of the area
+        :type: str
+        :param area_type: Type of the area
+        :type: str
+
+        :returns: The three variables and the area name, zeros and '' if the area has no records
+        :rtype: ((int, int, int), str)
+        """
+        params = {"name": area_name, "type": area_type, "window": SUMMARY_WINDOW, "skipped": SUMMARY_SKIPPED_DAYS}
+        with self.lock:
+            name, cases, hospital, deaths = self.connect().execute(AREA_SUMMARY, params).fetchone()
+        if name is None:
+            return (0, 0, 0), ''
+        return (int(cases), int(hospital or 0), int(deaths or 0)), name
+
+    def has_area(self, area_name: str, area_type: str) -> bool:
+        """
+        Checks whether the store has any records of an area
+
+        :param area_name: The area name
+        :type: str
+        :param area_type: The area type
+        :type: str
+
+        :rtype: bool
+        """
+        query = 'SELECT 1 FROM covid_records WHERE area_name = ? AND area_type = ? LIMIT 1'
+        with self.lock:
+            return self.connect().execute(query, (area_name, area_type)).fetchone() is not None
+
+    def areas(self) -> list:
+        """
+        Gets every area in the store
+
+        :returns: list of (area_name, area_type) pairs
+        :rtype: list
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT DISTINCT area_name, area_type FROM covid_records').fetchall()
+        return [(row['area_name'], row['area_type']) for row in rows]
+
+    def articles(self, limit: int = None) -> list:
+        """
+        Gets the stored news articles, newest first
+
+        :param limit: Most articles returned
+        :type: int
+
+        :returns: list of news articles
+        :rtype: list
+        """
+        query = 'SELECT url, title, description, content, source, published_at FROM news_articles ' \
+                'ORDER BY published_at DESC'
+        params = []
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self.lock:
+            rows = self.connect().execute(query, params).fetchall()
+        return [{"url": row['url'], "title": row['title'], "description": row['description'],
+                 "content": row['content'], "source": {"name": row['source']}, "publishedAt": row['published_at']}
+                for row in rows]
+
+    def articles_after(self, updated: int = 0, published_since: str = None) -> list:
+        """
+        Gets the news articles added or changed after a number of the updated sequence, in the order
+        they were written
+
+        :param updated: The last number of the updated sequence already seen, 0 for every article
+        :type: int
+        :param published_since: Leaves out articles published before this ISO 8601 time, articles
+            without a published time are always included
+        :type: str
+
+        :returns: list of (updated, news article)
+        :rtype: list
+        """
+        query = 'SELECT url, title, description, content, published_at, updated FROM news_articles WHERE updated > ?'
+        params = [updated]
+        if published_since is not None:
+            query += ' AND (published_at IS NULL OR published_at >= ?)'
+            params.append(published_since)
+        query += ' ORDER BY updated'
+        with self.lock:
+            rows = self.connect().execute(query, params).fetchall()
+        return [(row['updated'], {"url": row['url'], "title": row['title'], "description": row['description'],
+                                  "content": row['content'], "publishedAt": row['published_at']}) for row in rows]
+
+    def close(self) -> None:
+        """
+        Closes the connection to the database
+
+        :rtype: None
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -1,15 +1,94 @@
 """
 This module is for handling the covid news data
 """
-from requests import get
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from json import load
-from sched import scheduler
+from urllib.parse import urlsplit
 import time
 import logging
+import math
+import re
+from http_session import api_get
+from instrumentation import UPSTREAM_SECONDS, UPSTREAM_ERRORS, FILE_LOAD_SECONDS
+from scheduler_service import TimedScheduler
 
-news_scheduler = scheduler(time.time, time.sleep)
+news_scheduler = TimedScheduler(time.time, time.sleep)
 
+NEWS_API_URL = 'https://newsapi.org/v2/everything'
 
+# Query parameters that only track where a click came from, other parameters can pick out the article
+TRACKING_PARAMS = re.compile(r'^(utm_\w*|at_\w*|fbclid|gclid|ocid|cmpid)$', re.IGNORECASE)
+
+# The api key is read from config.json on first use
+news_api_key = None
+
+
+def get_api_key() -> str:
+    """
+    Gets the news api key, only reading the config file the first time
+
+    :return: The api key
+    :rtype: str
+    """
+    global news_api_key
+    if news_api_key is None:
+        with FILE_LOAD_SECONDS.time(file='config.json'), open('config.json', 'r') as f:
+            news_api_key = load(f)['key']
+    return news_api_key
+
+
+def news_page_request(term: str, api_key: str) -> dict:
+    """
+    Requests one page of articles for a single search term
+
+    :param term: The search term
+    :type: str
+    :param api_key: The news api key
+    :type: str
+
+    :return: The decoded api response
+    :rtype: dict
+    """
+    api_params = {
+        "q": term,
+        "sources": 'bbc-news',
+        "language": 'en',
+        "sortBy": 'relevancy',
+        "apiKey": api_key
+    }
+    try:
+        with UPSTREAM_SECONDS.time(call='news_page_request'):
+            response = api_get(NEWS_API_URL, params=api_params)
+    except Exception:
+        UPSTREAM_ERRORS.inc(api='news')
+        raise
+    if response.status_code >= 400:
+        UPSTREAM_ERRORS.inc(api='news')
+        logging.error(f'Request failed: {response.text}')
+        raise RuntimeError(f'Request failed: {response.text}')
+    return response.json()
+
+
+def stream_news_articles(terms: list) -> list:
+    """
+    Requests every search term at once and yields the articles of each page as it arrives, so a
+    slow term doesn't hold back the others
+
+    :param terms: list of search terms
+    :type: list
+
+    :returns: news articles
+    :rtype: list
+    """
+    api_key = get_api_key()
+    with ThreadPoolExecutor(max_workers=max(len(terms), 1)) as pool:
+        pages = [pool.submit(news_page_request, term, api_key) for term in terms]
+        for page in as_completed(pages):
+            for article in page.result()["articles"]:
+                yield article
+
+
+@UPSTREAM_SECONDS.time(call='news_api_request')
 def news_api_request(covid_terms: str = "Covid Covid-19 coronavirus") -> dict:
     """
     Requests data from the covid news api for python
@@ -20,49 +99,90 @@ def news_api_request(covid_terms: str = "Covid Covid-19 coronavirus") -> dict:
     :return: list of news articles
     :rtype: list
     """
+    covid_terms_arr = list(dict.fromkeys(covid_terms.lower().split()))
 
-    with open('config.json', 'r') as f:
-        cfg = load(f)
-        api_key = cfg['key']
-    endpoint = 'https://newsapi.org/v2/everything?'
-    sort_by = 'relevancy'
-    sources = 'bbc-news'
-    language = 'en'
-
-    covid_terms = covid_terms.lower()
-    covid_terms_arr = covid_terms.split(" ")
-    news_arr = []
-    fin_arr = []
-    for i in covid_terms_arr:
-        temp_article = get(f'{endpoint}q={i}&sources={sources}&language={language}&sortBy={sort_by}&apiKey={api_key}')
-        if temp_article.status_code >= 400:
-            logging.error(f'Request failed: {temp_article.text}')
-            raise RuntimeError(f'Request failed: {temp_article.text}')
-        news_arr.append(temp_article.json())
-    for i in news_arr:
-        for j in i["articles"]:
-            fin_arr.append(j)
-
-    arr = list(remove_duplicates(fin_arr))
+    arr = list(remove_duplicates(stream_news_articles(covid_terms_arr)))
     new_dictionary = {'articles': arr}
     return new_dictionary
 
 
-def remove_duplicates(arr: list) -> list:
+def normalise_url(url: str) -> str:
+    """
+    Normalises an article url so copies of the same link compare equal
+
+    :param url: The article url
+    :type: str
+
+    :return: The url without its scheme, tracking parameters, fragment or trailing slash
+    :rtype: str
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    host = host[4:] if host.startswith('www.') else host
+    url = host + parts.path.rstrip('/')
+    if parts.query:
+        # Sorted so the same parameters in another order still match
+        params = sorted(param for param in parts.query.split('&')
+                        if param and not TRACKING_PARAMS.match(param.split('=', 1)[0]))
+        if params:
+            url += '?' + '&'.join(params)
+    return url
+
+
+def normalise_title(title: str) -> str:
     """
-    Removes duplicates from the list of news articles
+    Normalises an article title to lowercase words without punctuation
+
+    :param title: The article title
+    :type: str
+
+    :return: The normalised title
+    :rtype: str
+    """
+    return ' '.join(re.findall(r'\w+', title.lower()))
+
+
+def remove_duplicates(arr: list, similarity: float = None) -> list:
+    """
+    Removes duplicates from the list of news articles. Articles are the same if their
+    normalised url or title has been seen already, so copies that only differ in content
+    or publish time are dropped. If a similarity is given, articles whose title words
+    overlap a seen title by at least that fraction are dropped too
 
     :param arr: list of news articles
     :type: list
+    :param similarity: Jaccard similarity of title words from 0 to 1 counted as a duplicate
+    :type: float
 
     :returns: news article if it's not seen already
     :rtype: list
     """
-    seen_already = []
+    seen_urls = set()
+    seen_titles = set()
+    # Maps a title word to the word sets of seen titles with that word in their prefix
+    title_index = {}
     for x in arr:
-        if x not in seen_already:
-            yield x
-            seen_already.append(x)
+        url = normalise_url(x.get('url') or '')
+        title = normalise_title(x.get('title') or '')
+        if (url and url in seen_urls) or (title and title in seen_titles):
+            continue
+
+        if similarity is not None and title:
+            words_set = frozenset(title.split())
+            words = sorted(words_set)
+            # Titles at least this similar must share a word in the first prefix_len words
+            prefix_len = len(words) - math.ceil(similarity * len(words)) + 1
+            candidates = {c for w in words[:prefix_len] for c in title_index.get(w, ())}
+            if any(len(words_set & c) / len(words_set | c) >= similarity for c in candidates):
+                continue
+            for w in words[:prefix_len]:
+                title_index.setdefault(w, []).append(words_set)
+
+        if url:
+            seen_urls.add(url)
+        if title:
+            seen_titles.add(title)
+        yield x
 
 
 def update_news(update_time: float = 84600.0, update_title: str = None) -> None:
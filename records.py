@@ -0,0 +1,169 @@
+"""
+This module has the record types for the covid rows, news articles and scheduled updates held in
+memory. They use __slots__ so each one is far smaller than the dictionary it replaces, can't be
+changed once made, and their fields can still be read with the JSON keys, record['title']
+"""
+
+# Imports
+from operator import attrgetter
+
+
+class Record:
+    """Base of the record types, subclasses set __slots__ and the JSON key of each slot in KEYS"""
+
+    __slots__ = ()
+    KEYS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        """Works out the lookups of a record type from its slots and keys"""
+        super().__init_subclass__(**kwargs)
+        cls.SLOT_OF_KEY = dict(zip(cls.KEYS, cls.__slots__))
+        names = tuple(cls.__slots__)
+        if len(names) > 1:
+            getter = attrgetter(*names)
+            cls.values = lambda self: getter(self)
+        else:
+            # attrgetter of a single name gives the value itself instead of a tuple of one
+            cls.values = lambda self: tuple(getattr(self, name) for name in names)
+
+    def __init__(self, *values):
+        """
+        Initialisation function for the class
+
+        :param values: The value of each slot in order, missing values are None
+        :type: object
+        """
+        for name, value in zip(self.__slots__, values + (None,) * (len(self.__slots__) - len(values))):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} records can't be changed, use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} records can't be changed")
+
+    def __getitem__(self, key: str) -> object:
+        try:
+            return getattr(self, self.SLOT_OF_KEY[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.SLOT_OF_KEY
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and other.values() == self.values()
+
+    def __hash__(self) -> int:
+        return hash(self.values())
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={value!r}" for name, value in zip(self.__slots__, self.values()))
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        # Pickling goes through the constructor as the slots can't be set afterwards
+        return type(self), self.values()
+
+    def __copy__(self) -> 'Record':
+        # Records can't be changed so copies can share them
+        return self
+
+    def __deepcopy__(self, memo: dict) -> 'Record':
+        return self
+
+    def get(self, key: str, default: object = None) -> object:
+        """
+        Gets a field by its JSON key
+
+        :param key: The JSON key
+        :type: str
+        :param default: Returned if the key isn't a field
+        :type: object
+
+        :returns: The value
+        :rtype: object
+        """
+        slot = self.SLOT_OF_KEY.get(key)
+        return default if slot is None else getattr(self, slot)
+
+    def replace(self, **changes) -> 'Record':
+        """
+        Makes a copy with some fields changed
+
+        :returns: The new record
+        :rtype: Record
+        """
+        return type(self)(*(changes.get(name, value) for name, value in zip(self.__slots__, self.values())))
+
+    def to_dict(self) -> dict:
+        """
+        Converts the record into its JSON dictionary
+
+        :returns: The dictionary
+        :rtype: dict
+        """
+        return dict(zip(self.KEYS, self.values()))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Record':
+        """
+        Makes a record from a JSON dictionary, other keys in the dictionary are dropped
+
+        :param data: The dictionary
+        :type: dict
+
+        :returns: The record
+        :rtype: Record
+        """
+        return cls(*map(data.get, cls.KEYS))
+
+    @classmethod
+    def of(cls, data: object) -> 'Record':
+        """
+        Gets a record from either a record or its JSON dictionary
+
+        :param data: The record or dictionary
+        :type: object
+
+        :returns: The record
+        :rtype: Record
+        """
+        return data if isinstance(data, cls) else cls.from_dict(data)
+
+
+class CovidRecord(Record):
+    """One day of the covid data of an area, as in a covid api row"""
+
+    __slots__ = ('area_code', 'area_name', 'area_type', 'date', 'new_cases', 'hospital_cases', 'cum_deaths')
+    KEYS = ('areaCode', 'areaName', 'areaType', 'date', 'newCasesByPublishDate', 'hospitalCases',
+            'cumDeaths28DaysByDeathDate')
+
+
+class Article(Record):
+    """A news article with only the fields the website uses"""
+
+    __slots__ = ('title', 'content', 'url')
+    KEYS = ('title', 'content', 'url')
+
+
+class ScheduledUpdate(Record):
+    """An update the user scheduled, due is the time it next comes up in seconds since the epoch"""
+
+    __slots__ = ('title', 'content', 'alarm', 'repeat', 'data', 'news', 'due')
+    KEYS = ('title', 'content', 'alarm', 'repeat', 'data', 'news', 'due')
+
+
+def to_json(value: object) -> object:
+    """
+    The default function of json.dump and json.dumps, converting records into dictionaries
+
+    :param value: A value the json module can't serialise
+    :type: object
+
+    :returns: The dictionary of a record
+    :rtype: dict
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,117 @@
+"""
+This module elects one worker process to refresh the covid data and news, so running many
+workers doesn't multiply the api requests
+"""
+
+# Imports
+import logging
+import os
+import time
+from threading import Lock
+from state_persistence import JsonStateFile
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, msvcrt locks files there instead
+    fcntl = None
+    import msvcrt
+
+
+class RefreshCoordinator:
+    """
+    Leader election over a lock file. The worker holding the lock runs the refreshes, the others
+    write their refresh requests to a shared file for the leader to pick up
+    """
+
+    def __init__(self, lock_filename: str = 'refresh.lock', requests_filename: str = 'refresh_requests.json'):
+        """
+        Initialisation function for the class
+
+        :param lock_filename: The file locked by the leader
+        :type: str
+        :param requests_filename: The file the other workers write refresh requests to
+        :type: str
+        """
+        self.lock_filename = lock_filename
+        self.requests_file = JsonStateFile(requests_filename, default={})
+        self.lock = Lock()
+        self.lock_file = None
+        self.refreshes = {}
+        # Time of the last request handled for each kind of refresh
+        self.handled = {}
+
+    def register(self, kind: str, refresh) -> None:
+        """
+        Adds a kind of refresh
+
+        :param kind: Name of the refresh, such as 'data' or 'news'
+        :type: str
+        :param refresh: The function that runs the refresh
+        :type: function
+
+        :rtype: None
+        """
+        self.refreshes[kind] = refresh
+
+    @property
+    def is_leader(self) -> bool:
+        """
+        Whether this worker holds the lock
+
+        :rtype: bool
+        """
+        return self.lock_file is not None
+
+    def try_lead(self) -> bool:
+        """
+        Tries to take the lock without waiting, the lock is held until the process exits
+
+        :returns: True if this worker is the leader
+        :rtype: bool
+        """
+        with self.lock:
+            if self.lock_file is not None:
+                return True
+            lock_file = open(self.lock_filename, 'a+')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                lock_file.close()
+                return False
+            self.lock_file = lock_file
+            logging.info(f"Worker {os.getpid()} is the refresh leader")
+            return True
+
+    def request(self, kind: str) -> None:
+        """
+        Runs a refresh if this worker is the leader, otherwise asks the leader to run it
+
+        :param kind: Name of the refresh
+        :type: str
+
+        :rtype: None
+        """
+        if self.try_lead():
+            self.handled[kind] = time.time()
+            self.refreshes[kind]()
+        else:
+            self.requests_file.update(lambda requests: requests.update({kind: time.time()}))
+            logging.info(f"Asked the refresh leader to refresh {kind}")
+
+    def poll(self) -> None:
+        """
+        Takes over as leader if the last one has gone, then runs any refreshes the other workers asked for
+
+        :rtype: None
+        """
+        if not self.try_lead():
+            return
+        for kind, requested in self.requests_file.read().items():
+            if kind in self.refreshes and requested > self.handled.get(kind, 0):
+                self.handled[kind] = time.time()
+                self.refreshes[kind]()
@@ -0,0 +1,87 @@
+"""
+This module keeps refreshes from piling up by coalescing concurrent refreshes, the circuit breakers
+and retry delays are in resilience
+"""
+
+# Imports
+import logging
+from threading import Lock, Thread, Event
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one run, the other callers share its result"""
+
+    def __init__(self):
+        """Initialisation function for the class"""
+        self.lock = Lock()
+        # Maps a key to [finished event, result, error] of the run in flight
+        self.in_flight = {}
+
+    def run(self, key: str, func) -> object:
+        """
+        Runs func, or waits for the run already in flight for key and returns its result
+
+        :param key: What is being run, such as 'data' or 'news'
+        :type: str
+        :param func: The function to run
+        :type: function
+
+        :returns: The result of func
+        :rtype: object
+        """
+        with self.lock:
+            flight = self.in_flight.get(key)
+            leading = flight is None
+            if leading:
+                flight = self.in_flight[key] = [Event(), None, None]
+
+        if not leading:
+            logging.info(f"Joined the {key} refresh already running")
+            flight[0].wait()
+        else:
+            try:
+                flight[1] = func()
+            except Exception as run_err:
+                flight[2] = run_err
+            finally:
+                with self.lock:
+                    del self.in_flight[key]
+                flight[0].set()
+
+        if flight[2] is not None:
+            raise flight[2]
+        return flight[1]
+
+    def start(self, key: str, func) -> bool:
+        """
+        Runs func on a background thread unless a run for key is already in flight
+
+        :param key: What is being run
+        :type: str
+        :param func: The function to run
+        :type: function
+
+        :returns: True if a new run was started
+        :rtype: bool
+        """
+        with self.lock:
+            if key in self.in_flight:
+                return False
+        Thread(target=self.run_logged, args=(key, func), daemon=True).start()
+        return True
+
+    def run_logged(self, key: str, func) -> None:
+        """
+        Runs func like run(), logging any error instead of raising it
+
+        :param key: What is being run
+        :type: str
+        :param func: The function to run
+        :type: function
+
+        :rtype: None
+        """
+        try:
+            self.run(key, func)
+        except Exception as run_err:
+            logging.error(f"{run_err}: Background {key} refresh failed")
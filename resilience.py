@@ -0,0 +1,98 @@
+"""
+This module has the pieces that keep calls to the apis from failing hard: circuit breakers and
+jittered retry delays
+"""
+
+# Imports
+import logging
+import random
+import time
+from threading import Lock
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream service that has been failing"""
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an upstream service after a number of failures in a row. After reset_timeout
+    seconds one trial call is let through, closing the circuit again if it succeeds
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        """
+        Initialisation function for the class
+
+        :param name: Name of the upstream service, used in the logs
+        :type: str
+        :param failure_threshold: Failures in a row that open the circuit
+        :type: int
+        :param reset_timeout: Seconds the circuit stays open before a trial call
+        :type: float
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def before_call(self) -> None:
+        """
+        Checks a call is allowed, raising CircuitOpenError if it isn't
+
+        :rtype: None
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.trial_running or time.time() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            self.trial_running = True
+
+    def record_success(self) -> None:
+        """
+        Records a successful call, closing the circuit
+
+        :rtype: None
+        """
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info(f"Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        """
+        Records a failed call, opening the circuit once there have been too many in a row
+
+        :rtype: None
+        """
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logging.error(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.time()
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    Gets a random delay before retrying, up to an exponentially growing limit, so clients that
+    failed together don't all retry at the same moment
+
+    :param attempt: Number of tries so far, starting from 0
+    :type: int
+    :param base: Limit of the delay after the first try in seconds
+    :type: float
+    :param cap: Largest limit in seconds
+    :type: float
+
+    :returns: The delay in seconds
+    :rtype: float
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
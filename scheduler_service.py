@@ -0,0 +1,107 @@
+"""
+This module runs the schedulers on a background thread so updates happen on time,
+without waiting for someone to load the page
+"""
+
+# Imports
+import logging
+import time
+from sched import scheduler
+from threading import Thread, Event
+from instrumentation import SCHEDULER_LAG
+
+
+class TimedScheduler(scheduler):
+    """sched.scheduler that records how late each of its events runs after it was due"""
+
+    def enterabs(self, due: float, priority: int, action, argument: tuple = (), kwargs: dict = None):
+        """
+        Schedules an event, like sched.scheduler.enterabs
+
+        :param due: Time the event is due
+        :type: float
+        :param priority: Order of events due at the same time, lowest first
+        :type: int
+        :param action: function called when the event is due
+        :type: function
+        :param argument: Positional arguments of action
+        :type: tuple
+        :param kwargs: Keyword arguments of action
+        :type: dict
+
+        :returns: The event, for cancel()
+        :rtype: sched.Event
+        """
+        def timed_action(*args, **keywords):
+            SCHEDULER_LAG.observe(max(self.timefunc() - due, 0))
+            return action(*args, **keywords)
+
+        return super().enterabs(due, priority, timed_action, argument, {} if kwargs is None else kwargs)
+
+
+class SchedulerService(Thread):
+    """Background thread that owns and runs the update schedulers"""
+
+    def __init__(self, schedulers: list, poll_interval: float = 1.0):
+        """
+        Initialisation function for the class
+
+        :param schedulers: list of the queues to run, TimedScheduler or anything with the run(blocking=False)
+            method of sched.scheduler
+        :type: list
+        :param poll_interval: Longest time in seconds between checking the queues for new events
+        :type: float
+        """
+        super().__init__(name='scheduler-service', daemon=True)
+        self.schedulers = schedulers
+        self.poll_interval = poll_interval
+        self.wake_event = Event()
+        self.stop_event = Event()
+
+    def run_pending(self) -> float:
+        """
+        Runs every event that is due on all the schedulers
+
+        :returns: Seconds until the next event is due
+        :rtype: float
+        """
+        next_delay = self.poll_interval
+        for queue in self.schedulers:
+            try:
+                delay = queue.run(blocking=False)
+            except Exception as run_err:
+                logging.error(f"{run_err}: Scheduled update failed")
+                # The rest of the queue is run on the next pass
+                delay = 0
+            if delay is not None:
+                next_delay = min(next_delay, delay)
+        return next_delay
+
+    def run(self) -> None:
+        """
+        Runs the schedulers until the service is stopped
+
+        :rtype: None
+        """
+        logging.info("Scheduler service started")
+        while not self.stop_event.is_set():
+            delay = self.run_pending()
+            self.wake_event.wait(max(delay, 0))
+            self.wake_event.clear()
+
+    def wake(self) -> None:
+        """
+        Wakes the service to check the queues, used after an event is added
+
+        :rtype: None
+        """
+        self.wake_event.set()
+
+    def stop(self) -> None:
+        """
+        Stops the service
+
+        :rtype: None
+        """
+        self.stop_event.set()
+        self.wake_event.set()
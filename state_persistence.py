@@ -0,0 +1,180 @@
+"""
+This module reads and writes the JSON state files safely from many threads and processes
+"""
+
+# Imports
+import os
+import tempfile
+from contextlib import contextmanager
+from copy import deepcopy
+from json import load, dump
+from threading import RLock
+from instrumentation import FILE_LOAD_SECONDS
+from records import to_json
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, msvcrt locks files there instead
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(filename: str) -> None:
+    """
+    Holds an exclusive lock on filename + '.lock' so only one thread or process writes the file at a time
+
+    :param filename: The file being protected
+    :type: str
+
+    :rtype: None
+    """
+    with open(f"{filename}.lock", 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write_json(filename: str, data: object) -> None:
+    """
+    Writes JSON to a temporary file next to filename and renames it over filename, so readers
+    only ever see the old or the new file and never a half written one
+
+    :param filename: The file written
+    :type: str
+    :param data: The data written
+    :type: object
+
+    :rtype: None
+    """
+    with file_lock(filename):
+        replace_json(filename, data)
+
+
+def replace_json(filename: str, data: object) -> None:
+    """
+    Does the write of atomic_write_json, for callers already holding the file lock
+
+    :param filename: The file written
+    :type: str
+    :param data: The data written
+    :type: object
+
+    :rtype: None
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    file_descriptor, temp_name = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(file_descriptor, 'w') as file:
+            dump(data, file, default=to_json)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, filename)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+def file_signature(filename: str) -> tuple:
+    """
+    Gets the modification time, size and inode of a file, which change whenever it is rewritten
+
+    :param filename: The file
+    :type: str
+
+    :returns: The signature or None if the file doesn't exist
+    :rtype: tuple
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class JsonStateFile:
+    """
+    A JSON state file with an in-memory copy. Readers share the copy, which is never changed in place,
+    and it is only reloaded when the file on disk changes
+    """
+
+    def __init__(self, filename: str, default: object = None, decode=None):
+        """
+        Initialisation function for the class
+
+        :param filename: The JSON file
+        :type: str
+        :param default: The data used when the file doesn't exist yet
+        :type: object
+        :param decode: function converting the loaded JSON into the data held in memory
+        :type: function
+        """
+        self.filename = filename
+        self.default = default
+        self.decode = decode
+        self.lock = RLock()
+        # (file signature, data) swapped as one so readers never see a mismatched pair
+        self.snapshot = (None, None)
+
+    def read(self) -> object:
+        """
+        Gets the data of the file, only loading it again if it has changed on disk.
+        The result is shared so it must not be changed, use update() instead
+
+        :returns: The data
+        :rtype: object
+        """
+        signature = file_signature(self.filename)
+        if signature is None:
+            return self.default
+        cached_signature, data = self.snapshot
+        if signature == cached_signature:
+            return data
+        with FILE_LOAD_SECONDS.time(file=os.path.basename(self.filename)), open(self.filename, 'r') as file:
+            data = load(file)
+        if self.decode is not None:
+            data = self.decode(data)
+        self.snapshot = (signature, data)
+        return data
+
+    def write(self, data: object) -> None:
+        """
+        Replaces the data and writes it to the file atomically
+
+        :param data: The new data
+        :type: object
+
+        :rtype: None
+        """
+        with self.lock:
+            atomic_write_json(self.filename, data)
+            self.snapshot = (file_signature(self.filename), data)
+
+    def update(self, change) -> object:
+        """
+        Changes a copy of the data and writes it, readers keep the old copy until the write is done.
+        The file stays locked from the read to the write so changes from other processes aren't lost
+
+        :param change: function given a copy of the data to change in place
+        :type: function
+
+        :returns: The new data
+        :rtype: object
+        """
+        with self.lock, file_lock(self.filename):
+            data = deepcopy(self.read())
+            change(data)
+            replace_json(self.filename, data)
+            self.snapshot = (file_signature(self.filename), data)
+        return data
@@ -0,0 +1,72 @@
+import time
+from area_scheduler import AreaScheduler, configured_areas
+
+
+def make_config(count, **settings):
+    return {'local_location': 'Exeter', 'local_location_type': 'ltla', 'national_location': 'England',
+            'national_location_type': 'nation',
+            'areas': [dict(settings, name=f'Area {n}', type='ltla') for n in range(count)]}
+
+
+def test_configured_areas_include_the_dashboard_locations():
+    areas = configured_areas(make_config(2, refresh_interval=600, priority=3))
+    assert [(area['name'], area['priority']) for area in areas] == [('Exeter', 0), ('England', 0),
+                                                                    ('Area 0', 3), ('Area 1', 3)]
+    assert areas[2]['max_staleness'] == 1200 and areas[0]['refresh_interval'] == 3600
+
+
+def test_areas_are_spread_over_their_interval():
+    cfg = make_config(298)
+    scheduler = AreaScheduler(lambda: cfg, lambda areas: areas)
+    shards = scheduler.areas(now=1000.0)
+    dues = sorted(shard.due for shard in shards.values())
+    assert len(dues) == 300 and dues[0] == 1000.0 and dues[-1] < 1000.0 + 3600
+    # No more than a couple of areas start in any one minute
+    assert max(sum(1 for due in dues if start <= due < start + 60) for start in dues) <= 6
+
+
+def test_batches_are_limited_and_most_urgent_first():
+    cfg = make_config(10)
+    scheduler = AreaScheduler(lambda: cfg, lambda areas: areas, batch_size=4)
+    scheduler.areas(now=1000.0)
+    scheduler.shards[('Area 9', 'ltla')].refreshed = 0.0
+
+    batch = scheduler.take_batch(8000.0)
+    assert batch[0].name == 'Area 9' and {shard.name for shard in batch[1:3]} == {'Exeter', 'England'}
+    assert len(scheduler.take_batch(8000.0)) == 4
+
+
+def test_failed_areas_back_off_and_refreshed_areas_move_on():
+    refreshed = []
+
+    def refresh(areas):
+        refreshed.extend(areas)
+        return [area for area in areas if area[0] != 'Area 0']
+
+    cfg = make_config(1)
+    scheduler = AreaScheduler(lambda: cfg, refresh, batch_size=10, batch_spacing=0)
+    # Set up an hour ago, so every area is due
+    scheduler.areas(now=time.time() - 3600)
+    delay = scheduler.run()
+
+    assert sorted(name for name, _ in refreshed) == ['Area 0', 'England', 'Exeter']
+    shards = scheduler.shards
+    assert shards[('Area 0', 'ltla')].failures == 1
+    assert shards[('Exeter', 'ltla')].due - shards[('Exeter', 'ltla')].refreshed <= 3600
+    assert 0 <= delay <= 60
+
+    # Changing the config keeps the state of the areas still in it
+    cfg = make_config(0)
+    assert list(scheduler.areas()) == [('Exeter', 'ltla'), ('England', 'nation')]
+    assert scheduler.shards[('Exeter', 'ltla')] is shards[('Exeter', 'ltla')]
+
+
+def test_refreshes_outside_the_scheduler_keep_the_spread():
+    cfg = make_config(3)
+    scheduler = AreaScheduler(lambda: cfg, lambda areas: areas)
+    shards = scheduler.areas(now=1000.0)
+    dues = {key: shard.due for key, shard in shards.items()}
+
+    scheduler.mark_refreshed([('Exeter', 'ltla'), ('Missing', 'ltla')], now=5000.0)
+    assert shards[('Exeter', 'ltla')].refreshed == 5000.0 and shards[('Area 0', 'ltla')].refreshed == 1000.0
+    assert {key: shard.due for key, shard in shards.items()} == dues
@@ -0,0 +1,55 @@
+from article_search import ArticleIndex, tokenize
+from metrics_store import MetricsStore
+
+
+def make_article(n, title, description='', content=''):
+    return {'url': f'https://example.com/{n}', 'title': title, 'description': description, 'content': content}
+
+
+def test_tokenize_drops_stop_words_and_truncation():
+    assert tokenize('The Covid cases in Exeter… [+1234 chars]') == ['covid', 'cases', 'exeter']
+    assert tokenize(None) == []
+
+
+def test_search_matches_every_word_and_ranks_titles_first():
+    index = ArticleIndex()
+    index.add(make_article(1, 'Vaccine rollout', content='Booster doses in Exeter'))
+    index.add(make_article(2, 'Exeter booster clinic', description='Vaccine appointments'))
+    index.add(make_article(3, 'Weather'))
+
+    assert [article['title'] for article in index.search('exeter booster')] == ['Exeter booster clinic',
+                                                                               'Vaccine rollout']
+    assert index.search('exeter weather') == [] and index.search('the') == []
+
+    # Adding an article with the same url replaces it
+    index.add(make_article(2, 'Hospital cases'))
+    assert [article['title'] for article in index.search('booster')] == ['Vaccine rollout']
+
+
+def test_sync_only_indexes_new_articles(tmp_path):
+    store = MetricsStore(str(tmp_path / 'covid_data.db'))
+    index = ArticleIndex()
+    store.upsert_articles([make_article(1, 'Vaccine rollout')])
+    assert index.sync(store) == 1 and index.sync(store) == 0
+
+    store.upsert_articles([make_article(1, 'Vaccine rollout'), make_article(2, 'Vaccine clinic')])
+    assert index.sync(store) == 1
+    assert len(index.search('vaccine')) == 2
+
+    # Articles changed in place are indexed again
+    store.upsert_articles([make_article(1, 'Booster rollout')])
+    assert index.sync(store) == 1
+    assert [article['title'] for article in index.search('rollout')] == ['Booster rollout']
+
+
+def test_old_articles_are_dropped(tmp_path):
+    store = MetricsStore(str(tmp_path / 'covid_data.db'))
+    index = ArticleIndex(max_age=24 * 3600)
+    store.upsert_articles([dict(make_article(1, 'Vaccine rollout'), publishedAt='2021-12-01T09:00:00Z'),
+                           dict(make_article(2, 'Vaccine clinic'), publishedAt='2021-12-02T09:00:00Z')])
+    assert index.sync(store, now=1638435600.0) == 2
+
+    # A day later, 2021-12-03 09:00 UTC, the first article is too old to be found
+    assert index.sync(store, now=1638522000.0) == 0
+    assert [article['title'] for article in index.search('vaccine')] == ['Vaccine clinic']
+    assert 'rollout' not in index.postings and len(index.ids) == 1
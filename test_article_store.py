@@ -0,0 +1,32 @@
+from json import dump, load
+from article_store import ArticleStore
+
+
+def make_articles(count):
+    return [{'title': f'Article {i}', 'content': f'Content {i}'} for i in range(count)]
+
+
+def test_current_and_remove(tmp_path):
+    filename = tmp_path / 'covid_news.json'
+    with open(filename, 'w') as file:
+        dump(make_articles(6), file)
+    store = ArticleStore(str(filename))
+
+    assert [i['title'] for i in store.current()] == ['Article 0', 'Article 1', 'Article 2', 'Article 3']
+    assert store.remove('Article 1')
+    assert not store.remove('Article 1')
+    assert store.remove('Article 5')
+    assert [i['title'] for i in store.current()] == ['Article 0', 'Article 2', 'Article 3', 'Article 4']
+
+
+def test_removed_articles_stay_removed(tmp_path):
+    filename = tmp_path / 'covid_news.json'
+    store = ArticleStore(str(filename))
+    store.replace(make_articles(3))
+    store.remove('Article 0')
+    store.replace(make_articles(5))
+    assert [i['title'] for i in store.current()] == ['Article 1', 'Article 2', 'Article 3', 'Article 4']
+
+    store.save()
+    with open(filename) as file:
+        assert [i['title'] for i in load(file)] == ['Article 1', 'Article 2', 'Article 3', 'Article 4']
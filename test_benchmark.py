@@ -0,0 +1,12 @@
+from benchmark import BENCHMARKS, compare, run_benchmarks
+
+
+def test_compare_finds_regressions():
+    baseline = {'fast': 1.0, 'slow': 1.0}
+    assert compare({'fast': 1.2, 'slow': 2.0, 'new': 5.0}, baseline, tolerance=0.5) == [('slow', 2.0, 1.0)]
+
+
+def test_benchmarks_run_offline():
+    results = run_benchmarks(scale=1, repeat=1)
+    assert set(results) == set(BENCHMARKS)
+    assert all(seconds > 0 for seconds in results.values())
@@ -2,6 +2,10 @@ from covid_data_handling import parse_csv_data
 from covid_data_handling import process_covid_csv_data
 from covid_data_handling import covid_api_request
 from covid_data_handling import schedule_covid_updates
+from covid_data_handling import fetch_area
+from covid_data_handling import fetch_areas
+from covid_data_handling import process_covid_csv_file
+from covid_data_handling import summarise_csv_rows
 
 
 def test_parse_csv_data():
@@ -25,3 +29,112 @@ def test_covid_api_request():
 
 def test_schedule_covid_updates():
     schedule_covid_updates(update_interval=10, update_name='update test')
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ''
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def test_fetch_area_caches_and_revalidates(monkeypatch):
+    import covid_data_handling
+    calls = []
+
+    def fake_api_get(url, params=None, headers=None, timeout=None):
+        calls.append(headers)
+        if headers.get('If-None-Match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(data={'data': [{'areaName': 'Exeter'}]}, headers={'ETag': '"v1"'})
+
+    monkeypatch.setattr(covid_data_handling, 'api_get', fake_api_get)
+    monkeypatch.setattr(covid_data_handling, 'area_cache', {})
+
+    first = fetch_area('Exeter', 'ltla')
+    assert fetch_area('Exeter', 'ltla') is first
+    assert len(calls) == 1
+
+    # An expired entry is revalidated and reused when the api says it hasn't changed
+    assert fetch_area('Exeter', 'ltla', max_age=0) is first
+    assert calls[1] == {'If-None-Match': '"v1"'}
+
+
+def test_fetch_area_serves_stale_on_error(monkeypatch):
+    import covid_data_handling
+    responses = [FakeResponse(data={'data': [{'areaName': 'Exeter'}]}), FakeResponse(503)]
+
+    monkeypatch.setattr(covid_data_handling, 'api_get', lambda *args, **kwargs: responses.pop(0))
+    monkeypatch.setattr(covid_data_handling, 'area_cache', {})
+
+    first = fetch_area('Exeter', 'ltla')
+    assert fetch_area('Exeter', 'ltla', max_age=0) is first
+
+
+def test_fetch_areas_concurrently(monkeypatch):
+    import json
+    import time
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit, parse_qs
+    import covid_data_handling
+
+    delay = 0.3
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            filters = parse_qs(urlsplit(self.path).query)['filters'][0]
+            name = dict(f.split('=') for f in filters.split(';'))['areaName']
+            time.sleep(delay)
+            body = json.dumps({'data': [{'areaName': name}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(covid_data_handling, 'COVID_API_URL', f'http://127.0.0.1:{server.server_port}/v1/data')
+    monkeypatch.setattr(covid_data_handling, 'area_cache', {})
+
+    areas = [(f'Area {i}', 'ltla') for i in range(6)]
+    try:
+        start = time.time()
+        results = fetch_areas(areas)
+        elapsed = time.time() - start
+    finally:
+        server.shutdown()
+
+    assert [results[area]['data'][0]['areaName'] for area in areas] == [area[0] for area in areas]
+    # Serially this would take len(areas) * delay
+    assert elapsed < len(areas) * delay / 2
+
+
+def test_process_covid_csv_file(tmp_path):
+    assert process_covid_csv_file('nation_2021-10-28.csv') == (240_299, 7_019, 141_544)
+
+    # Columns are found by their header, not their position
+    with open('nation_2021-10-28.csv') as file:
+        header, *rows = file.read().splitlines()
+    columns = header.split(',')
+    order = list(reversed(range(len(columns))))
+    reordered = tmp_path / 'reordered.csv'
+    reordered.write_text('\n'.join(','.join(line.split(',')[i] for i in order) for line in [header] + rows))
+    assert process_covid_csv_file(str(reordered)) == (240_299, 7_019, 141_544)
+
+
+def test_summary_waits_for_a_hospital_value():
+    from covid_timeseries import CovidTimeSeries
+    rows = [{'date': f'2021-10-{28 - day}', 'newCasesBySpecimenDate': '10', 'hospitalCases': '' if day < 10 else '500',
+             'cumDailyNsoDeathsByDeathDate': '7'} for day in range(12)]
+    assert summarise_csv_rows(iter(rows)) == (70, 500, 7)
+    assert summarise_csv_rows(iter(rows)) == CovidTimeSeries.from_rows(rows, 'newCasesBySpecimenDate', 'hospitalCases',
+                                                                      'cumDailyNsoDeathsByDeathDate').summary()
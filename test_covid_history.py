@@ -0,0 +1,70 @@
+from datetime import date
+import covid_history
+import os
+from threading import Thread
+from covid_history import sync_area, sync_areas, load_entry, history_filename, merge_rows
+
+
+def make_row(day):
+    return {'areaName': 'Exeter', 'date': f'2021-10-{day:02d}', 'newCasesByPublishDate': day}
+
+
+def fake_api(calls, days, page_size=5):
+    rows = [make_row(day) for day in sorted(days, reverse=True)]
+
+    def covid_api_request(location, location_type, date=None, page=None):
+        calls.append((date, page))
+        if date is not None:
+            return {'data': [row for row in rows if row['date'] == date]}
+        page_rows = rows[(page - 1) * page_size:page * page_size]
+        has_next = page * page_size < len(rows)
+        return {'data': page_rows, 'pagination': {'next': 'next' if has_next else None}}
+    return covid_api_request
+
+
+def test_first_sync_downloads_every_page(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(covid_history, 'covid_api_request', fake_api(calls, range(1, 13)))
+    data = sync_area('Exeter', 'ltla', str(tmp_path), today=date(2021, 10, 12))
+    assert [row['date'] for row in data] == [f'2021-10-{day:02d}' for day in range(12, 0, -1)]
+    assert calls == [(None, 1), (None, 2), (None, 3)]
+    assert load_entry(history_filename('Exeter', 'ltla', str(tmp_path)))['last_date'] == '2021-10-12'
+
+
+def test_later_syncs_only_request_new_days(monkeypatch, tmp_path):
+    calls = []
+    filename = history_filename('Exeter', 'ltla', str(tmp_path))
+    merge_rows(filename, [make_row(day) for day in range(10, 0, -1)])
+    monkeypatch.setattr(covid_history, 'covid_api_request', fake_api(calls, range(1, 13)))
+    data = sync_area('Exeter', 'ltla', str(tmp_path), today=date(2021, 10, 12))
+    assert sorted(calls) == [('2021-10-09', None), ('2021-10-10', None), ('2021-10-11', None), ('2021-10-12', None)]
+    # Days 9 and 10 were downloaded again but haven't changed
+    assert [row['date'] for row in data] == ['2021-10-12', '2021-10-11']
+    assert len(load_entry(filename)['data']) == 12
+
+
+def test_long_gaps_stop_paging_at_the_last_date(monkeypatch, tmp_path):
+    calls = []
+    filename = history_filename('Exeter', 'ltla', str(tmp_path))
+    monkeypatch.setattr(covid_history, 'covid_api_request', fake_api(calls, range(1, 31)))
+    merge_rows(filename, [make_row(day) for day in range(20, 0, -1)])
+
+    result = sync_areas([('Exeter', 'ltla')], str(tmp_path))
+    assert len(result[('Exeter', 'ltla')]['data']) == 10
+    assert calls == [(None, 1), (None, 2), (None, 3)]
+    assert load_entry(filename)['last_date'] == '2021-10-30'
+
+
+def test_areas_have_their_own_files_and_merges_keep_every_row(tmp_path):
+    filename = history_filename('Bristol, City of', 'ltla', str(tmp_path))
+    threads = [Thread(target=merge_rows, args=(filename, [make_row(day)])) for day in range(1, 21)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(load_entry(filename)['data']) == 20
+
+    # Unchanged rows don't rewrite the file
+    modified = os.stat(filename).st_mtime_ns
+    assert merge_rows(filename, [make_row(5)]) == [] and os.stat(filename).st_mtime_ns == modified
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.json')] == [os.path.basename(filename)]
@@ -0,0 +1,33 @@
+import numpy as np
+from covid_timeseries import CovidTimeSeries
+
+
+def make_series(days=21):
+    dates = [f'2021-10-{i + 1:02d}' for i in range(days)]
+    cases = [10 * (i + 1) for i in range(days)]
+    hospital = [100 + i for i in range(days - 1)] + ['']
+    deaths = [1000 + i for i in range(days - 3)] + [None, None, None]
+    return CovidTimeSeries('Exeter', dates, cases, hospital, deaths)
+
+
+def test_rolling_metrics():
+    series = make_series()
+    sums = series.rolling_sum('cases')
+    assert np.isnan(sums[5])
+    assert sums[6] == sum(10 * (i + 1) for i in range(7))
+    assert series.window_sum('cases') == sum(10 * (i + 1) for i in range(12, 19))
+    assert np.isclose(series.rate('cases', 1000, per=100)[6], sums[6] / 10)
+    assert series.week_on_week()[13] == sums[13] / sums[6] - 1
+
+
+def test_summary_uses_last_present_values():
+    assert make_series().summary() == (sum(10 * (i + 1) for i in range(12, 19)), 119, 1017)
+
+
+def test_from_api_rows_newest_first():
+    rows = [{'areaName': 'Exeter', 'date': f'2021-10-{i:02d}', 'newCasesByPublishDate': i,
+             'hospitalCases': None if i == 10 else i, 'cumDeaths28DaysByDeathDate': 5} for i in range(10, 0, -1)]
+    series = CovidTimeSeries.from_api_rows(rows)
+    assert series.area_name == 'Exeter'
+    assert str(series.dates[-1]) == '2021-10-10'
+    assert series.summary() == (sum(range(2, 9)), 9, 5)
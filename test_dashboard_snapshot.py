@@ -0,0 +1,43 @@
+from dashboard_snapshot import DashboardSnapshot, StateVersion
+
+
+def test_rebuilt_only_after_invalidate():
+    builds = []
+    snapshot = DashboardSnapshot()
+
+    def build():
+        builds.append(1)
+        return f'page {len(builds)}'
+
+    first = snapshot.get(build)
+    assert snapshot.get(build) == first and len(builds) == 1
+    snapshot.invalidate()
+    assert snapshot.get(build) != first and len(builds) == 2
+
+
+def test_shared_file_invalidates_other_workers(tmp_path):
+    shared = str(tmp_path / 'dashboard_version.json')
+    worker, other_worker = DashboardSnapshot(shared), DashboardSnapshot(shared)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return f'page {len(builds)}'
+
+    worker.get(build)
+    other_worker.get(build)
+    assert len(builds) == 2
+
+    other_worker.invalidate()
+    worker.get(build)
+    assert len(builds) == 3
+    # The workers agree on when the dashboard last changed
+    assert worker.changed == other_worker.changed
+
+
+def test_state_version_moves_on_with_each_change():
+    versions = StateVersion()
+    version, changed = versions.state()
+    versions.invalidate()
+    assert versions.state()[0] == version + 1 and versions.state()[1] >= changed
+    assert not hasattr(versions, 'html')
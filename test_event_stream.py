@@ -0,0 +1,48 @@
+import time
+from event_stream import EventBroker, format_event
+
+
+def test_format_event():
+    assert format_event('data', {'a': 1}, 3) == 'id: 3\nevent: data\ndata: {"a":1}\n\n'
+
+
+def test_reconnect_gets_missed_events():
+    broker = EventBroker()
+    broker.publish('news', {'n': 1})
+    seen = broker.publish('news', {'n': 2})
+    last = broker.publish('news', {'n': 3})
+
+    subscription = broker.subscribe(last_event_id=seen)
+    assert subscription.queue.get_nowait() == format_event('news', {'n': 3}, last)
+    assert subscription.queue.empty()
+
+
+def test_ids_carry_over_to_other_workers():
+    worker = EventBroker()
+    seen = worker.publish('news', {'n': 1})
+    time.sleep(0.002)
+    # Another worker, or this one after a restart, only replays the events published since
+    other_worker = EventBroker()
+    last = other_worker.publish('news', {'n': 2})
+    assert last > seen
+    subscription = other_worker.subscribe(last_event_id=seen)
+    assert subscription.queue.get_nowait() == format_event('news', {'n': 2}, last)
+    assert other_worker.subscribe(last_event_id=last).queue.empty()
+
+
+def test_slow_subscriber_dropped():
+    broker = EventBroker(queue_size=2)
+    subscription = broker.subscribe()
+    for n in range(3):
+        broker.publish('data', n)
+    assert subscription.closed and subscription not in broker.subscriptions
+
+
+def test_stream_sends_heartbeats_and_idle_events():
+    broker = EventBroker()
+    stream = broker.stream(heartbeat=0.01, idle=lambda: [('changed', {})])
+    assert next(stream).startswith('retry:')
+    assert next(stream) == format_event('changed', {})
+    assert next(stream).startswith(':')
+    stream.close()
+    assert not broker.subscriptions
@@ -0,0 +1,35 @@
+import os
+from instrumentation import Counter, Histogram, RequestProfiler, format_labels, render_metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_seconds', 'Test timings', ('call',), buckets=(0.1, 1.0), registry=[])
+    histogram.observe(0.05, call='a')
+    histogram.observe(0.5, call='a')
+    histogram.observe(5, call='a')
+    samples = {(name, labels.get('le')): value for name, labels, value in histogram.samples()}
+    assert samples[('test_seconds_bucket', '0.1')] == 1
+    assert samples[('test_seconds_bucket', '1.0')] == 2
+    assert samples[('test_seconds_bucket', '+Inf')] == 3
+    assert samples[('test_seconds_sum', None)] == 5.55
+
+
+def test_render_metrics_text_format():
+    registry = []
+    counter = Counter('test_hits_total', 'Test hits', ('cache',), registry)
+    counter.inc(cache='area')
+    counter.inc(2, cache='area')
+    text = render_metrics(registry)
+    assert '# TYPE test_hits_total counter' in text
+    assert 'test_hits_total{cache="area"} 3.0' in text
+    assert format_labels({'path': 'a"b'}) == '{path="a\\"b"}'
+    # Test metrics aren't served with the real ones
+    assert 'test_hits_total' not in render_metrics()
+
+
+def test_request_profiler_saves_one_profile_at_a_time(tmp_path):
+    profiler = RequestProfiler(str(tmp_path))
+    profile = profiler.start()
+    assert profiler.start() is None
+    filename = profiler.stop(profile, 'render_app')
+    assert os.path.exists(filename) and filename.endswith('render_app.prof')
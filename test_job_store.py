@@ -0,0 +1,81 @@
+import time
+from datetime import datetime
+from job_store import JobStore, next_due
+from records import ScheduledUpdate
+
+
+def make_update(title, alarm='09:00', repeat=False):
+    return {'title': title, 'content': '', 'alarm': alarm, 'repeat': repeat, 'data': True, 'news': False}
+
+
+def test_next_due_is_the_next_clock_time():
+    morning = datetime(2021, 12, 1, 8, 0).timestamp()
+    assert next_due('09:00', morning) == datetime(2021, 12, 1, 9, 0).timestamp()
+    assert next_due('07:30', morning) == datetime(2021, 12, 2, 7, 30).timestamp()
+
+
+def test_updates_survive_a_restart(tmp_path):
+    filename = str(tmp_path / 'scheduled_updates.json')
+    store = JobStore(filename)
+    store.add(make_update('daily', repeat=True))
+    store.add(make_update('once'))
+    store.remove('once')
+    # Single changes are saved together in the background
+    assert JobStore(filename).get('daily') is None
+    store.save()
+    restarted = JobStore(filename)
+    assert restarted.get('daily')['repeat'] and restarted.get('once') is None
+
+
+def test_missed_runs_caught_up_once(tmp_path):
+    ran = []
+    store = JobStore(str(tmp_path / 'scheduled_updates.json'), on_due=ran.append)
+    three_days_ago = time.time() - 3 * 24 * 60 * 60
+    store.add(make_update('daily', repeat=True), now=three_days_ago)
+    store.add(make_update('once'), now=three_days_ago)
+
+    delay = store.run()
+    assert sorted(job['title'] for job in ran) == ['daily', 'once']
+    assert store.get('once') is None
+    assert store.get('daily')['due'] > time.time() and 0 < delay <= 24 * 60 * 60
+
+
+def test_thousands_of_updates_run_in_due_order(tmp_path):
+    ran = []
+    store = JobStore(str(tmp_path / 'scheduled_updates.json'), on_due=lambda job: ran.append(job['title']))
+    start = time.time() - 2 * 24 * 60 * 60
+
+    def add_many(jobs):
+        jobs.update((str(n), ScheduledUpdate.from_dict(make_update(str(n))).replace(due=start + 3000 - n))
+                    for n in range(3000))
+        return [(job.due, title) for title, job in jobs.items()]
+
+    store.change(add_many)
+    store.add(make_update('later'))
+    store.remove('2999')
+
+    store.run()
+    assert ran == [str(n) for n in range(2998, -1, -1)]
+    assert [job['title'] for job in store.updates()] == ['later']
+
+
+def test_only_one_process_runs_an_update(tmp_path):
+    filename = str(tmp_path / 'scheduled_updates.json')
+    ran = []
+    first, second = JobStore(filename, on_due=ran.append), JobStore(filename, on_due=ran.append)
+    first.add(make_update('once'), now=time.time() - 24 * 60 * 60)
+    second.jobs()
+
+    first.run()
+    second.run()
+    assert len(ran) == 1
+
+
+def test_apply_batches_and_compacts_index(tmp_path):
+    store = JobStore(str(tmp_path / 'scheduled_updates.json'))
+    assert store.apply([make_update(str(n)) for n in range(100)], []) == (100, 0)
+    for _ in range(3):
+        store.apply([make_update(str(n), alarm='10:00') for n in range(100)], ['missing'])
+    assert len(store.heap) <= 2 * 100 + 64
+    assert store.apply([], [str(n) for n in range(50)]) == (0, 50)
+    assert len(store.updates()) == 50
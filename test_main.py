@@ -0,0 +1,252 @@
+import shutil
+import pytest
+from flask import Flask
+import main
+from article_store import ArticleStore
+from article_search import ArticleIndex
+from dashboard_snapshot import DashboardSnapshot, StateVersion
+from json_api import ApiCache
+from event_stream import EventBroker
+from job_store import JobStore
+from metrics_store import MetricsStore
+
+
+def make_row(area_name, area_type, day):
+    return {'areaName': area_name, 'areaType': area_type, 'date': f'2021-10-{day:02d}',
+            'newCasesByPublishDate': day, 'hospitalCases': 100, 'cumDeaths28DaysByDeathDate': 50}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    for name in ('config.json', 'covid_news.json'):
+        shutil.copy(name, tmp_path / name)
+    monkeypatch.chdir(tmp_path)
+    store = MetricsStore(str(tmp_path / 'covid_data.db'))
+    store.upsert_records([make_row('Exeter', 'ltla', day) for day in range(1, 15)] +
+                         [make_row('England', 'nation', day) for day in range(1, 15)])
+    monkeypatch.setattr(main, 'metrics_store', store)
+    monkeypatch.setattr(main, 'article_index', ArticleIndex())
+    monkeypatch.setattr(main, 'dump_news', lambda s=None: None)
+    monkeypatch.setattr(main, 'dump_data', lambda s=None: None)
+    monkeypatch.setattr(main, 'news_store', ArticleStore(str(tmp_path / 'covid_news.json')))
+    monkeypatch.setattr(main, 'dashboard', DashboardSnapshot())
+    monkeypatch.setattr(main, 'api_cache', ApiCache())
+    monkeypatch.setattr(main, 'area_versions', StateVersion())
+    monkeypatch.setattr(main, 'area_api_cache', ApiCache())
+    monkeypatch.setattr(main, 'event_broker', EventBroker())
+    monkeypatch.setattr(main, 'job_store', JobStore(str(tmp_path / 'scheduled_updates.json')))
+
+    server = main.Covid19DataHub()
+    app = Flask(main.__name__)
+    app.add_url_rule('/', view_func=server.render_app)
+    app.add_url_rule('/index/', view_func=server.app_updates)
+    app.add_url_rule('/api/areas', view_func=server.api_areas)
+    app.add_url_rule('/api/areas/<area_type>/<area_name>', view_func=server.api_area)
+    app.add_url_rule('/api/areas/<area_type>/<area_name>/summary', view_func=server.api_area_summary)
+    app.add_url_rule('/api/articles', view_func=server.api_articles)
+    app.add_url_rule('/api/articles/search', view_func=server.api_article_search)
+    app.add_url_rule('/api/updates', view_func=server.api_updates, methods=['POST'])
+    app.add_url_rule('/events', view_func=server.event_stream)
+    app.add_url_rule('/metrics', view_func=server.metrics)
+    main.instrument_app(app)
+    return app.test_client()
+
+
+def test_render_app_conditional(client):
+    first = client.get('/')
+    assert first.status_code == 200
+    assert b'Exeter' in first.data and b'England' in first.data
+
+    repeat = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert repeat.status_code == 304
+
+
+def test_snapshot_rebuilt_after_article_removed(client):
+    first = client.get('/')
+    title = main.news_store.current()[0]['title']
+    client.get('/index/', query_string={'notif': title})
+
+    after = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != first.headers['ETag']
+
+
+def test_add_and_remove_updates(client):
+    client.get('/index/', query_string={'two': 'daily', 'update': '09:00', 'repeat': 'repeat', 'covid-data': 'covid-data'})
+    client.get('/index/', query_string={'two': 'once', 'update': '10:00', 'news': 'news'})
+    page = client.get('/').data
+    assert b'daily' in page and b'once' in page
+
+    assert main.job_store.get('daily')['repeat'] and main.job_store.get('once')['news']
+
+    client.get('/index/', query_string={'update_item': 'daily'})
+    page = client.get('/').data
+    assert b'daily' not in page and b'once' in page
+
+
+def test_api_areas_fields_and_conditional(client):
+    first = client.get('/api/areas', query_string={'fields': 'areaName,last7DaysCases'})
+    assert first.status_code == 200 and first.is_json
+    assert sorted(first.get_json(), key=lambda area: area['areaName']) == [
+        {'areaName': 'England', 'last7DaysCases': 63}, {'areaName': 'Exeter', 'last7DaysCases': 63}]
+    assert 's-maxage' in first.headers['Cache-Control'] and first.headers['Last-Modified']
+
+    repeat = client.get('/api/areas', query_string={'fields': 'areaName,last7DaysCases'},
+                        headers={'If-None-Match': first.headers['ETag']})
+    assert repeat.status_code == 304
+
+
+def test_api_compressed_responses(client):
+    import gzip
+    import json
+
+    plain = client.get('/api/articles')
+    packed = client.get('/api/articles', headers={'Accept-Encoding': 'gzip'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in packed.headers['Vary']
+    assert json.loads(gzip.decompress(packed.data)) == plain.get_json()
+    assert packed.headers['ETag'] != plain.headers['ETag']
+
+    history = client.get('/api/areas/ltla/Exeter', query_string={'limit': 3, 'fields': 'date'})
+    assert history.get_json() == [{'date': '2021-10-14'}, {'date': '2021-10-13'}, {'date': '2021-10-12'}]
+
+
+def test_api_cache_keeps_the_most_recently_used_bodies():
+    cache = ApiCache(max_size=2)
+    for key in ('a', 'b', 'a', 'c'):
+        cache.get(key, 1, lambda: [key])
+    assert list(cache.bodies) == ['a', 'c']
+
+
+def test_removal_pushed_to_event_stream(client):
+    title = main.news_store.current()[0]['title']
+    client.get('/index/', query_string={'notif': title})
+
+    response = client.get('/events', headers={'Last-Event-ID': '0'}, buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+    event = next(chunks).decode()
+    response.close()
+    assert 'event: article-removed' in event and title in event
+
+
+def test_metrics_endpoint(client):
+    client.get('/')
+    client.get('/')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'datahub_template_render_seconds_count{template="index.html"}' in text
+    assert 'datahub_cache_requests_total{cache="dashboard",result="hit"}' in text
+    assert 'datahub_http_request_seconds_bucket{endpoint="render_app",method="GET",status="200",le="+Inf"}' in text
+
+
+def test_warm_caches_renders_saved_state(client, tmp_path, monkeypatch):
+    from refresh_coordinator import RefreshCoordinator
+    coordinator = RefreshCoordinator(str(tmp_path / 'refresh.lock'), str(tmp_path / 'refresh_requests.json'))
+    refreshed = []
+    coordinator.register('news', lambda: refreshed.append('news'))
+    coordinator.register('data', lambda: refreshed.append('data'))
+    monkeypatch.setattr(main, 'coordinator', coordinator)
+
+    main.warm_caches(main.Covid19DataHub())
+    assert main.dashboard.built_version == main.dashboard.version
+    assert refreshed == ['news', 'data']
+
+
+def test_import_defers_heavy_modules(tmp_path):
+    import os
+    import subprocess
+    import sys
+    code = "import sys, main; print('numpy' in sys.modules, 'requests' in sys.modules)"
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(main.__file__)))
+    output = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert output.stdout.split() == ['False', 'False']
+
+
+def test_batch_updates_without_render(client):
+    adds = [{'title': f'area {n}', 'alarm': '09:00', 'data': True} for n in range(200)]
+    response = client.post('/api/updates', json={'add': adds})
+    assert response.get_json() == {'added': 200, 'removed': 0, 'updates': 200}
+    assert main.dashboard.built_version == -1
+
+    response = client.post('/api/updates', json={'add': [{'title': 'daily', 'alarm': '10:00', 'repeat': True}],
+                                                 'remove': [f'area {n}' for n in range(150)]})
+    assert response.get_json() == {'added': 1, 'removed': 150, 'updates': 51}
+    assert main.job_store.get('daily')['content'] == '10:00 repeat None None'
+
+    # Nothing is changed when one of the updates is invalid
+    response = client.post('/api/updates', json={'add': [{'title': 'new', 'alarm': '09:00'},
+                                                         {'title': 'bad', 'alarm': '25:00'}]})
+    assert response.status_code == 400 and main.job_store.get('new') is None
+
+    # Only lists are taken, not a title or update on its own
+    for body in ({'remove': 'daily'}, {'add': {'title': 'new', 'alarm': '09:00'}}, {'add': ['new']}):
+        assert client.post('/api/updates', json=body).status_code == 400
+    assert main.job_store.get('daily') is not None and len(main.job_store.updates()) == 51
+
+
+def test_area_picker_and_summary(client, monkeypatch):
+    main.config_file.update(lambda cfg: cfg.update(areas=[{"name": "Leeds", "type": "ltla"}]))
+    main.metrics_store.upsert_records([make_row('Leeds', 'ltla', day) for day in range(1, 15)])
+    page = client.get('/')
+    assert b'value="ltla/Leeds"' in page.data
+
+    summary = client.get('/api/areas/ltla/Leeds/summary').get_json()
+    assert summary == {'areaName': 'Leeds', 'areaType': 'ltla', 'last7DaysCases': 63,
+                       'hospitalCases': 100, 'totalDeaths': 50}
+    summary = client.get('/api/areas/ltla/Leeds/summary', query_string={'fields': 'areaName,totalDeaths'})
+    assert summary.get_json() == {'areaName': 'Leeds', 'totalDeaths': 50}
+
+
+def test_refresh_areas_publishes_the_refreshed_areas(client, monkeypatch):
+    monkeypatch.setattr(main, 'config_file', main.JsonStateFile('config.json'))
+    main.config_file.update(lambda cfg: cfg.update(incremental_sync=False))
+    monkeypatch.setattr(main, 'fetch_areas', lambda areas: {area: {"data": [make_row(*area, 20)]}
+                                                            for area in areas if area[0] != 'Failing'})
+
+    assert main.refresh_areas([('Leeds', 'ltla'), ('Failing', 'ltla')]) == [('Leeds', 'ltla')]
+    assert [message.split('\n')[1] for _, message in main.event_broker.history] == ['event: areas']
+    assert main.metrics_store.area_history('Leeds', 'ltla')[0]['date'] == '2021-10-20'
+    # An area not on the page only changes the version of the area api
+    assert main.dashboard.version == 0 and main.area_versions.version == 1
+
+    # Refreshing again without any changes invalidates nothing
+    assert main.refresh_areas([('Leeds', 'ltla')]) == [('Leeds', 'ltla')]
+    assert main.area_versions.version == 1 and len(main.event_broker.history) == 1
+
+    main.refresh_areas([('Exeter', 'ltla')])
+    assert main.dashboard.version == 1 and main.event_broker.history[-2][1].split('\n')[1] == 'event: data'
+
+
+def test_incremental_sync_fills_a_new_database(client, monkeypatch):
+    from covid_history import history_filename, merge_rows
+    monkeypatch.setattr(main, 'config_file', main.JsonStateFile('config.json'))
+    main.config_file.update(lambda cfg: cfg.update(incremental_sync=True))
+    merge_rows(history_filename('Leeds', 'ltla'), [make_row('Leeds', 'ltla', day) for day in range(1, 21)])
+    monkeypatch.setattr(main, 'sync_areas', lambda areas: {
+        area: {"data": merge_rows(history_filename(*area), [make_row(*area, 21)])} for area in areas})
+
+    # Only day 21 is new to the history, the database gets the days it had already too
+    assert main.refresh_areas([('Leeds', 'ltla')]) == [('Leeds', 'ltla')]
+    assert len(main.metrics_store.area_history('Leeds', 'ltla')) == 21
+
+
+def test_article_search(client):
+    articles = main.news_store.all_articles()
+    main.metrics_store.upsert_articles([article.to_dict() for article in articles])
+    word = articles[0]['title'].split()[-1]
+
+    results = client.get(f'/api/articles/search?q={word}&limit=100&fields=title').get_json()
+    assert {'title': articles[0]['title']} in results
+    assert len(client.get(f'/api/articles/search?q={word}&limit=1').get_json()) == 1
+    assert client.get('/api/articles/search?q=zzzznotaword').get_json() == []
+
+
+def test_app_only_started_once(monkeypatch):
+    started = main.SchedulerService([])
+    started.start()
+    started.stop()
+    started.join(2)
+    monkeypatch.setattr(main, 'scheduler_service', started)
+    with pytest.raises(RuntimeError):
+        main.start_app()
@@ -0,0 +1,41 @@
+from metrics_store import MetricsStore
+
+
+def make_row(day, cases, area_name='Exeter'):
+    return {'areaCode': f'code-{area_name}', 'areaName': area_name, 'areaType': 'ltla', 'date': f'2021-10-{day:02d}',
+            'newCasesByPublishDate': cases, 'hospitalCases': None, 'cumDeaths28DaysByDeathDate': day}
+
+
+def test_records_upsert_and_query(tmp_path):
+    store = MetricsStore(str(tmp_path / 'covid_data.db'))
+    assert store.upsert_records([make_row(day, 1) for day in range(1, 11)] + [make_row(1, 5, 'Bristol')]) == 11
+    assert store.upsert_records([make_row(10, 3), make_row(9, 1)]) == 1
+
+    history = store.area_history('Exeter', 'ltla', start='2021-10-05', end='2021-10-10')
+    assert [row['date'] for row in history] == [f'2021-10-{day:02d}' for day in range(10, 4, -1)]
+    assert history[0]['newCasesByPublishDate'] == 3
+    assert store.area_summary('Exeter', 'ltla') == ((7, 0, 10), 'Exeter')
+    assert store.area_summary('Nowhere', 'ltla') == ((0, 0, 0), '')
+    assert sorted(store.areas()) == [('Bristol', 'ltla'), ('Exeter', 'ltla')]
+
+
+def test_articles_upsert(tmp_path):
+    store = MetricsStore(str(tmp_path / 'covid_data.db'))
+    store.upsert_articles([{'title': 'Old', 'url': 'a', 'publishedAt': '2021-12-01T00:00:00Z'},
+                           {'title': 'New', 'url': 'b', 'publishedAt': '2021-12-02T00:00:00Z'}])
+    assert store.upsert_articles([{'title': 'Old updated', 'url': 'a', 'publishedAt': '2021-12-01T00:00:00Z'},
+                                  {'title': 'New', 'url': 'b', 'publishedAt': '2021-12-02T00:00:00Z'}]) == 1
+    assert [i['title'] for i in store.articles()] == ['New', 'Old updated']
+    assert len(store.articles(limit=1)) == 1
+    assert [(updated, article['title']) for updated, article in store.articles_after(1)] == [(2, 'New'),
+                                                                                          (3, 'Old updated')]
+    assert [article['title'] for _, article in store.articles_after(0, '2021-12-02')] == ['New']
+
+
+def test_area_summary_matches_the_time_series(tmp_path):
+    from covid_timeseries import CovidTimeSeries
+    store = MetricsStore(str(tmp_path / 'covid_data.db'))
+    rows = [dict(make_row(day, day * 10), hospitalCases=None if day > 25 else day,
+                 cumDeaths28DaysByDeathDate=None if day > 28 else day) for day in range(30, 0, -1)]
+    store.upsert_records(rows)
+    assert store.area_summary('Exeter', 'ltla') == (CovidTimeSeries.from_api_rows(rows).summary(), 'Exeter')
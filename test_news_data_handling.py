@@ -1,5 +1,7 @@
 from news_data_handling import news_api_request
 from news_data_handling import update_news
+from news_data_handling import remove_duplicates
+from news_data_handling import normalise_url
 
 
 def test_news_api_request():
@@ -9,3 +11,90 @@ def test_news_api_request():
 
 def test_update_news():
     update_news(10, 'test')
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.status_code = 200
+        self.text = ''
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def test_news_api_request_fans_out(monkeypatch):
+    import time
+    import news_data_handling
+    calls = []
+
+    def fake_api_get(url, params=None):
+        calls.append(params['q'])
+        time.sleep(0.2)
+        return FakeResponse({'articles': [{'title': params['q']}, {'title': 'shared'}]})
+
+    monkeypatch.setattr(news_data_handling, 'api_get', fake_api_get)
+    monkeypatch.setattr(news_data_handling, 'news_api_key', 'key')
+
+    start = time.time()
+    articles = news_api_request('Covid covid-19 coronavirus')['articles']
+    assert time.time() - start < 0.4
+    assert sorted(calls) == ['coronavirus', 'covid', 'covid-19']
+    assert sorted(i['title'] for i in articles) == ['coronavirus', 'covid', 'covid-19', 'shared']
+
+
+def test_slow_term_does_not_hold_back_the_others(monkeypatch):
+    import time
+    import news_data_handling
+
+    def fake_api_get(url, params=None):
+        time.sleep(0.3 if params['q'] == 'slow' else 0)
+        return FakeResponse({'articles': [{'title': params['q']}]})
+
+    monkeypatch.setattr(news_data_handling, 'api_get', fake_api_get)
+    monkeypatch.setattr(news_data_handling, 'news_api_key', 'key')
+
+    start = time.time()
+    articles = news_data_handling.stream_news_articles(['slow', 'fast'])
+    assert next(articles)['title'] == 'fast' and time.time() - start < 0.2
+    assert [i['title'] for i in articles] == ['slow']
+
+
+def test_remove_duplicates_fingerprint():
+    articles = [
+        {'title': 'Covid: New rules', 'url': 'https://www.bbc.co.uk/news/1', 'content': 'a'},
+        {'title': 'Covid: New rules', 'url': 'https://www.bbc.co.uk/news/1', 'content': 'b'},
+        {'title': 'Covid - new rules!', 'url': 'https://bbc.co.uk/news/2', 'content': 'c'},
+        {'title': 'Covid: new rules announced today', 'url': 'https://bbc.co.uk/news/3'},
+        {'title': 'Vaccine rollout', 'url': 'http://bbc.co.uk/news/1/?at_medium=rss'},
+    ]
+    assert [i['content'] for i in remove_duplicates(articles) if 'content' in i] == ['a']
+    assert len(list(remove_duplicates(articles))) == 2
+    assert len(list(remove_duplicates(articles[:4], similarity=0.5))) == 1
+
+
+def test_normalise_url_keeps_meaningful_parameters():
+    assert normalise_url('http://www.BBC.co.uk/news/1/?utm_source=x&at_medium=rss#top') == 'bbc.co.uk/news/1'
+    assert normalise_url('https://example.com/story?id=1&utm_campaign=y') == 'example.com/story?id=1'
+    assert normalise_url('https://example.com/story?id=1') != normalise_url('https://example.com/story?id=2')
+    articles = [{'title': 'Covid cases rise', 'url': 'https://example.com/story?id=1'},
+                {'title': 'Vaccine clinic opens', 'url': 'https://example.com/story?id=2'}]
+    assert len(list(remove_duplicates(articles))) == 2
+
+
+def test_remove_duplicates_benchmark():
+    import time
+    articles = []
+    for i in range(12_000):
+        story = i % 6_000
+        articles.append({'title': f'Story {story} about covid cases in area {story % 50}',
+                         'url': f'https://www.bbc.co.uk/news/{story}',
+                         'content': f'copy {i}', 'publishedAt': f'2021-12-{i % 28 + 1:02d}'})
+
+    start = time.time()
+    assert len(list(remove_duplicates(articles))) == 6_000
+    assert time.time() - start < 1
+
+    start = time.time()
+    assert len(list(remove_duplicates(articles, similarity=0.9))) == 6_000
+    assert time.time() - start < 5
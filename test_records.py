@@ -0,0 +1,49 @@
+import pickle
+import sys
+from copy import deepcopy
+from json import dumps, loads
+import pytest
+from records import Record, CovidRecord, Article, ScheduledUpdate, to_json
+
+
+def make_row():
+    return {'areaCode': 'E07000041', 'areaName': 'Exeter', 'areaType': 'ltla', 'date': '2021-10-28',
+            'newCasesByPublishDate': 42, 'hospitalCases': None, 'cumDeaths28DaysByDeathDate': 180}
+
+
+def test_record_reads_like_its_dictionary():
+    record = CovidRecord.from_dict(make_row())
+    assert record['areaName'] == 'Exeter' and record.area_name == 'Exeter'
+    assert record.get('hospitalCases', 0) is None and record.get('missing', 0) == 0
+    assert 'date' in record and 'missing' not in record
+    assert record.to_dict() == make_row()
+    with pytest.raises(KeyError):
+        record['missing']
+
+
+def test_record_cannot_be_changed():
+    update = ScheduledUpdate('daily', '', '09:00', True, True, False)
+    with pytest.raises(AttributeError):
+        update.due = 0
+    assert update.replace(due=1.0).due == 1.0 and update.due is None
+    assert deepcopy(update) is update and pickle.loads(pickle.dumps(update)) == update
+
+
+def test_article_keeps_only_the_used_fields():
+    article = Article.from_dict({'title': 'Title', 'content': 'Content', 'url': 'https://example.com',
+                                 'description': 'Description', 'source': {'name': 'Source'}})
+    assert loads(dumps([article], default=to_json)) == [{'title': 'Title', 'content': 'Content',
+                                                         'url': 'https://example.com'}]
+    assert not hasattr(article, '__dict__')
+    assert sys.getsizeof(article) < sys.getsizeof(article.to_dict())
+
+
+class Tag(Record):
+    __slots__ = ('name',)
+    KEYS = ('name',)
+
+
+def test_record_with_one_field():
+    tag = Tag('covid')
+    assert tag.values() == ('covid',) and tag.to_dict() == {'name': 'covid'}
+    assert tag.replace(name='news').name == 'news' and pickle.loads(pickle.dumps(tag)) == tag
@@ -0,0 +1,35 @@
+from refresh_coordinator import RefreshCoordinator
+
+
+def make_coordinator(tmp_path, runs):
+    coordinator = RefreshCoordinator(str(tmp_path / 'refresh.lock'), str(tmp_path / 'refresh_requests.json'))
+    coordinator.register('data', lambda: runs.append(coordinator))
+    return coordinator
+
+
+def test_only_the_leader_refreshes(tmp_path):
+    runs = []
+    leader = make_coordinator(tmp_path, runs)
+    follower = make_coordinator(tmp_path, runs)
+
+    leader.request('data')
+    assert leader.is_leader and runs == [leader]
+
+    follower.request('data')
+    assert not follower.is_leader and runs == [leader]
+
+    # The leader picks up the request once
+    leader.poll()
+    leader.poll()
+    assert runs == [leader, leader]
+
+
+def test_follower_takes_over(tmp_path):
+    runs = []
+    leader = make_coordinator(tmp_path, runs)
+    follower = make_coordinator(tmp_path, runs)
+    assert leader.try_lead() and not follower.try_lead()
+
+    leader.lock_file.close()
+    follower.poll()
+    assert follower.is_leader
@@ -0,0 +1,28 @@
+import time
+from threading import Thread, Event
+from refresh_pipeline import SingleFlight
+
+
+def test_single_flight_coalesces_runs():
+    flight = SingleFlight()
+    started, release = Event(), Event()
+    runs = []
+
+    def refresh():
+        runs.append(1)
+        started.set()
+        release.wait()
+        return len(runs)
+
+    results = []
+    first = Thread(target=lambda: results.append(flight.run('data', refresh)))
+    first.start()
+    started.wait()
+    assert not flight.start('data', refresh)
+    second = Thread(target=lambda: results.append(flight.run('data', refresh)))
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join()
+    second.join()
+    assert runs == [1] and results == [1, 1]
@@ -0,0 +1,26 @@
+import time
+import pytest
+from resilience import CircuitBreaker, CircuitOpenError, backoff_delay
+
+
+def test_circuit_opens_and_recovers():
+    breaker = CircuitBreaker('api', failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.15)
+    # One trial call is let through, the rest wait for its result
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [backoff_delay(10, base=0.5, cap=2) for _ in range(100)]
+    assert all(0 <= delay <= 2 for delay in delays)
+    assert len(set(delays)) > 1
@@ -0,0 +1,47 @@
+import time
+from sched import scheduler
+from threading import Event
+from scheduler_service import SchedulerService, TimedScheduler
+
+
+def test_runs_events_in_background():
+    first = scheduler(time.time, time.sleep)
+    second = scheduler(time.time, time.sleep)
+    fired = [Event(), Event()]
+    service = SchedulerService([first, second], poll_interval=5)
+    service.start()
+    try:
+        first.enter(0.1, 1, fired[0].set)
+        second.enter(0.2, 1, fired[1].set)
+        service.wake()
+        assert fired[0].wait(2) and fired[1].wait(2)
+    finally:
+        service.stop()
+        service.join(2)
+    assert not service.is_alive()
+
+
+def test_failed_event_does_not_stop_service():
+    queue = scheduler(time.time, time.sleep)
+    fired = Event()
+    queue.enter(0, 1, lambda: 1 / 0)
+    queue.enter(0, 2, fired.set)
+    service = SchedulerService([queue], poll_interval=0.05)
+    service.start()
+    try:
+        assert fired.wait(2)
+    finally:
+        service.stop()
+
+
+
+def test_lag_recorded_for_every_event_run():
+    from instrumentation import SCHEDULER_LAG
+    queue = TimedScheduler(time.time, time.sleep)
+    for _ in range(3):
+        queue.enter(-1, 1, lambda: None)
+    queue.enter(60, 1, lambda: None)
+    observed = SCHEDULER_LAG.values.get((), [0] * (len(SCHEDULER_LAG.buckets) + 2))[-2]
+
+    SchedulerService([queue]).run_pending()
+    assert SCHEDULER_LAG.values[()][-2] == observed + 3 and len(queue.queue) == 1
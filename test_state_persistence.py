@@ -0,0 +1,51 @@
+import os
+from json import load
+from threading import Thread
+from state_persistence import atomic_write_json, JsonStateFile
+
+
+def test_atomic_write_leaves_no_temp_files(tmp_path):
+    filename = str(tmp_path / 'state.json')
+    atomic_write_json(filename, {'a': 1})
+    atomic_write_json(filename, {'a': 2})
+    with open(filename) as file:
+        assert load(file) == {'a': 2}
+    assert sorted(os.listdir(tmp_path)) == ['state.json', 'state.json.lock']
+
+
+def test_read_is_cached_until_the_file_changes(tmp_path):
+    filename = str(tmp_path / 'state.json')
+    state = JsonStateFile(filename, default={})
+    assert state.read() == {}
+
+    atomic_write_json(filename, {'a': 1})
+    first = state.read()
+    assert first == {'a': 1} and state.read() is first
+
+    new = state.update(lambda data: data.update(a=2))
+    assert first == {'a': 1}
+    assert state.read() is new and new == {'a': 2}
+
+
+def test_readers_never_see_a_partial_file(tmp_path):
+    filename = str(tmp_path / 'state.json')
+    big = {'rows': list(range(20_000))}
+    atomic_write_json(filename, big)
+    errors = []
+
+    def read_many():
+        for _ in range(200):
+            try:
+                with open(filename) as file:
+                    assert load(file) == big
+            except Exception as err:
+                errors.append(err)
+
+    readers = [Thread(target=read_many) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for _ in range(50):
+        atomic_write_json(filename, big)
+    for reader in readers:
+        reader.join()
+    assert not errors
@@ -0,0 +1,18 @@
+"""
+This module is the entry point for running the website with many worker processes, for example
+
+    gunicorn --workers 4 --threads 16 wsgi:app
+    waitress-serve wsgi:app
+
+Each worker elects itself or another worker to refresh the covid data and news and shares the
+results through the files and database. Don't use gunicorn's --preload, the workers need their
+own scheduler thread and refresh lock. Every open page holds a thread for its event stream, so
+gunicorn needs --threads or an async worker class
+"""
+
+# Imports
+import os
+from main import start_app
+
+# Setting DATAHUB_PROFILE_DIR saves a cProfile profile of every request to that directory
+app = start_app(shared=True, profile_dir=os.environ.get('DATAHUB_PROFILE_DIR'))